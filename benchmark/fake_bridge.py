@@ -0,0 +1,71 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import argparse
+import asyncio
+import json
+import uvicorn
+
+def create_app(tokens: int, tokens_per_second: float, first_token_latency: float, max_concurrent: int) -> FastAPI:
+    """
+    Args:
+        tokens: 1回の応答のトークン数
+        tokens_per_second: 1リクエストあたりの生成速度
+        first_token_latency: 最初のトークンまでの時間（プロンプト評価の時間、秒）
+        max_concurrent: 同時に生成できる数（超えた分はGPUの順番待ちと同様に待たせる、0は無制限）
+    """
+    app = FastAPI()
+    semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+
+    def create_tokens(messages: list) -> list:
+        question = messages[-1]["content"].strip() if messages else ""
+        return [f"{question[:10]}への回答{i} " if i == 0 else f"トークン{i} " for i in range(tokens)]
+
+    async def generate(messages: list):
+        await asyncio.sleep(first_token_latency)
+        for token in create_tokens(messages):
+            yield token
+            await asyncio.sleep(1 / tokens_per_second)
+
+    async def run(messages: list):
+        if semaphore is None:
+            async for token in generate(messages):
+                yield token
+            return
+        async with semaphore:
+            async for token in generate(messages):
+                yield token
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+
+        if not body.get("stream"):
+            content = "".join([token async for token in run(messages)])
+            return {"model": body.get("model"), "message": {"role": "assistant", "content": content}, "done": True}
+
+        async def stream():
+            async for token in run(messages):
+                yield json.dumps({"message": {"role": "assistant", "content": token}, "done": False}, ensure_ascii=False) + "\n"
+            yield json.dumps({"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": tokens}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ベンチマーク用にmcp-bridge（Ollama）の代わりとなるトークンを一定速度で返すサーバーを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--tokens", type=int, default=100, help="1回の応答のトークン数")
+    parser.add_argument("--tokens-per-second", type=float, default=30, help="1リクエストあたりの生成速度")
+    parser.add_argument("--first-token-latency", type=float, default=0.5, help="最初のトークンまでの時間（秒）")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="同時に生成できる数（0は無制限）")
+    args = parser.parse_args()
+
+    app = create_app(args.tokens, args.tokens_per_second, args.first_token_latency, args.max_concurrent)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
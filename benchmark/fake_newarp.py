@@ -0,0 +1,198 @@
+from fastapi import FastAPI, Request, Response
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import uvicorn
+
+# 社員名の部分一致検索が実データに近くなるよう、姓と名を組み合わせて作成する
+SURNAMES = ["山田", "佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "中村", "小林", "加藤"]
+GIVEN_NAMES = ["太郎", "花子", "一郎", "美咲", "健太", "陽子", "翔太", "由美", "大輔", "直樹"]
+SKILL_GROUPS = ["能力考課", "技術考課", "業績考課"]
+
+def get_division_short_name(index: int) -> str:
+    return f"DV{index}"
+
+def get_department_short_name(index: int) -> str:
+    return f"DP{index}"
+
+def get_group_short_name(index: int) -> str:
+    return f"GR{index}"
+
+def get_user_name(index: int) -> str:
+    return f"{SURNAMES[index % len(SURNAMES)]} {GIVEN_NAMES[index // len(SURNAMES) % len(GIVEN_NAMES)]}{index:05d}"
+
+def create_app(divisions: int, departments: int, groups: int, users: int, skills: int, latency: float) -> FastAPI:
+    """
+    Args:
+        divisions: 事業部数
+        departments: 事業部あたりの部門数
+        groups: 部門あたりのグループ数
+        users: 社員数
+        skills: 考課区分ごとの評価項目数
+        latency: 1リクエストあたりの応答遅延（秒）
+    """
+    app = FastAPI()
+    department_count = divisions * departments
+    group_count = department_count * groups
+
+    division_data = [{
+        "divisionCode": f"D{i:04d}",
+        "divisionName": f"第{i}事業部",
+        "divisionShortName": get_division_short_name(i),
+    } for i in range(divisions)]
+
+    department_data = [{
+        "departmentCode": f"P{i:05d}",
+        "divisionCode": f"D{i // departments:04d}",
+        "departmentName": f"第{i}部門",
+        "departmentShortName": get_department_short_name(i),
+    } for i in range(department_count)]
+
+    group_data = [{
+        "groupCode": f"G{i:06d}",
+        "departmentCode": f"P{i // groups:05d}",
+        "groupName": f"第{i}グループ",
+        "groupShortName": get_group_short_name(i),
+    } for i in range(group_count)]
+
+    user_data = [{
+        "userKey": str(100000 + i),
+        "userId": f"user{i}",
+        "userName": get_user_name(i),
+        "mailAddress": f"user{i}@example.com",
+        "groupShortName": get_group_short_name(i % group_count),
+        "position": "主任" if i % 5 == 0 else "",
+        "joiningDate": f"{2000 + i % 25}-04-01",
+    } for i in range(users)]
+
+    async def check_session(request: Request):
+        """
+        応答遅延を入れ、ログインしていない場合はNeWarpと同様にログイン画面（HTML）を返す
+        """
+        if latency > 0:
+            await asyncio.sleep(latency)
+        if request.cookies.get("SESSION") != "benchmark":
+            return Response("<html>login</html>", media_type="text/html")
+        return None
+
+    @app.post("/login")
+    async def login(response: Response):
+        if latency > 0:
+            await asyncio.sleep(latency)
+        response.set_cookie("SESSION", "benchmark")
+        return {"result": "ok"}
+
+    @app.post("/division")
+    async def division(request: Request):
+        return await check_session(request) or {"data": division_data}
+
+    @app.post("/department")
+    async def department(request: Request):
+        return await check_session(request) or {"data": department_data}
+
+    @app.post("/group")
+    async def group(request: Request):
+        return await check_session(request) or {"data": group_data}
+
+    @app.post("/user")
+    async def user(request: Request):
+        return await check_session(request) or {"data": user_data}
+
+    @app.post("/fb_interview_sheet")
+    async def fb_interview_sheet(request: Request):
+        error_response = await check_session(request)
+        if error_response:
+            return error_response
+
+        body = await request.json()
+        return {"data": {
+            "info": {
+                "periodName": body["goalManagementPeriodId"],
+                "vision": "チームを技術面で牽引できるエンジニアになる",
+                "appeal": "担当案件を期限内にリリースした",
+                "note": "特になし",
+                "evaluationKind": "開発",
+                "evaluationStage": "S3",
+                "evaluationClass": "C2",
+                "expectation": "後輩の育成",
+            },
+            "pastDetails": [{
+                "goal": f"目標{i}",
+                "condition": f"達成条件{i}",
+                "assessment": 60 + i * 10,
+                "comment": f"実行結果{i}",
+                "assessmentComment": f"コメント{i}",
+            } for i in range(3)],
+        }}
+
+    @app.post("/evaluation")
+    async def evaluation(request: Request):
+        error_response = await check_session(request)
+        if error_response:
+            return error_response
+
+        body = await request.json()
+        # 同じ社員・評価年月には常に同じ得点を返す
+        rand = random.Random(f"{body['userKey']}_{body['goalManagementPeriodId']}")
+        data = [{
+            "groupName": skill_group,
+            "evaluationKind": f"{skill_group}{i}",
+            "evaluationKindId": f"{skill_group}_{i}",
+            "itemPoints": rand.randint(1, 5),
+        } for skill_group in SKILL_GROUPS for i in range(skills)]
+        data_not_self = [dict(row, itemPoints=rand.randint(1, 5)) for row in data]
+        return {"data": data, "dataNotSelf": data_not_self}
+
+    return app
+
+def write_config(config_dir: Path, base_url: str, year_months: list):
+    """
+    mcp-newarpがこのサーバーにアクセスするためのurl.json・logininfo.jsonを作成する
+    """
+    config_dir.mkdir(parents=True, exist_ok=True)
+    urls = {
+        "LOGIN": f"{base_url}/login",
+        "GET_DIVISION_MASTER": f"{base_url}/division",
+        "GET_DEPARTMENT_MASTER": f"{base_url}/department",
+        "GET_GROUP_MASTER": f"{base_url}/group",
+        "GET_USER_MASTER": f"{base_url}/user",
+        "GET_FB_INTERVIEW_SHEET": f"{base_url}/fb_interview_sheet",
+        "GET_EVALUATION": f"{base_url}/evaluation",
+    }
+    for name in list(urls):
+        if name != "LOGIN":
+            urls[f"{name}_REFERER"] = base_url
+    login_info = {
+        "ENGAGE_CODE": "benchmark",
+        "USER_ID": "benchmark",
+        "PASSWORD": "benchmark",
+        "PROC_USER_KEY": "100000",
+        "FB_INTERVIEW_YEAR_MONTH": year_months,
+    }
+
+    with open(config_dir / "url.json", "w", encoding="utf-8") as f:
+        json.dump(urls, f, ensure_ascii=False, indent=2)
+    with open(config_dir / "logininfo.json", "w", encoding="utf-8") as f:
+        json.dump(login_info, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ベンチマーク用にNeWarpの代わりとなる合成データのサーバーを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--divisions", type=int, default=5, help="事業部数")
+    parser.add_argument("--departments", type=int, default=4, help="事業部あたりの部門数")
+    parser.add_argument("--groups", type=int, default=5, help="部門あたりのグループ数")
+    parser.add_argument("--users", type=int, default=2000, help="社員数")
+    parser.add_argument("--skills", type=int, default=10, help="考課区分ごとの評価項目数")
+    parser.add_argument("--latency", type=float, default=0.1, help="1リクエストあたりの応答遅延（秒）")
+    parser.add_argument("--write-config", type=Path, help="指定したディレクトリにこのサーバーを参照するurl.json・logininfo.jsonを作成する")
+    parser.add_argument("--year-months", nargs="+", default=["202304", "202310", "202404"], help="logininfo.jsonの評価年月")
+    args = parser.parse_args()
+
+    if args.write_config:
+        write_config(args.write_config, f"http://{args.host}:{args.port}", args.year_months)
+
+    app = create_app(args.divisions, args.departments, args.groups, args.users, args.skills, args.latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
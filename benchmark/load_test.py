@@ -0,0 +1,198 @@
+from fastmcp import Client
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import httpx
+from fake_newarp import get_department_short_name, get_division_short_name, get_group_short_name, get_user_name
+
+def percentile(values: list, p: float) -> float:
+    """
+    最近順位法で百分位数を求める
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+class Recorder:
+    """
+    計測項目ごとに所要時間とエラー件数を記録する
+    """
+    def __init__(self):
+        self.durations = {}
+        self.errors = {}
+
+    def record(self, name: str, seconds: float):
+        self.durations.setdefault(name, []).append(seconds)
+
+    def record_error(self, name: str, error: Exception):
+        self.errors.setdefault(name, []).append(str(error))
+
+    def summary(self, elapsed: float) -> list:
+        rows = []
+        for name in sorted(set(self.durations) | set(self.errors)):
+            durations = self.durations.get(name, [])
+            rows.append({
+                "name": name,
+                "count": len(durations),
+                "errors": len(self.errors.get(name, [])),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "p99": percentile(durations, 99),
+                "max": max(durations, default=0.0),
+                "throughput": len(durations) / elapsed if elapsed > 0 else 0.0,
+            })
+        return rows
+
+async def run_workers(concurrency: int, requests: int, run_one):
+    """
+    concurrency個のワーカーで合計requests件のrun_one(番号)を実行する
+    """
+    counter = iter(range(requests))
+
+    async def worker():
+        for index in counter:
+            await run_one(index)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+async def chat_scenario(args, recorder: Recorder):
+    """
+    /chat/stream に同時に質問を送り、最初の応答までの時間と応答完了までの時間を計測する
+    """
+    async with httpx.AsyncClient(timeout=args.timeout, limits=httpx.Limits(max_connections=args.chat_concurrency)) as client:
+        async def run_one(index: int):
+            question = f"{get_user_name(index % args.distinct_questions)}の得意なスキルは？"
+            start_time = time.perf_counter()
+            first_token_time = None
+            try:
+                async with client.stream(
+                    "POST", f"{args.web_url}/chat/stream",
+                    json={"user_id": f"benchmark{index}", "message": question},
+                ) as response:
+                    response.raise_for_status()
+                    event = None
+                    async for line in response.aiter_lines():
+                        if line.startswith("event:"):
+                            event = line.removeprefix("event:").strip()
+                        elif line.startswith("data:"):
+                            # 順番待ちの通知（event: queue）は応答に含めない
+                            if event is None and first_token_time is None and line != "data: [DONE]":
+                                first_token_time = time.perf_counter()
+                            event = None
+            except Exception as e:
+                recorder.record_error("chat_stream", e)
+                return
+
+            end_time = time.perf_counter()
+            recorder.record("chat_stream", end_time - start_time)
+            if first_token_time is not None:
+                recorder.record("chat_stream (最初の応答)", first_token_time - start_time)
+
+        await run_workers(args.chat_concurrency, args.chat_requests, run_one)
+
+def create_tool_calls(args) -> list:
+    """
+    合成データに存在する組織・社員を対象にツール呼び出しを作成する
+    """
+    department_count = args.divisions * args.departments
+    group_count = department_count * args.groups
+    return [
+        ("get_company_organization_master", lambda: {}),
+        ("get_division_master", lambda: {"divisionShortName": get_division_short_name(random.randrange(args.divisions))}),
+        ("get_department_master", lambda: {"departmentShortName": get_department_short_name(random.randrange(department_count))}),
+        ("get_group_master", lambda: {"groupShortName": get_group_short_name(random.randrange(group_count))}),
+        ("get_user_master_user_name", lambda: {"userName": get_user_name(random.randrange(args.users)).split(" ")[0]}),
+        ("get_user_master_group_short_name", lambda: {"groupShortName": get_group_short_name(random.randrange(group_count))}),
+        ("get_user_evaluation", lambda: {"userName": get_user_name(random.randrange(args.evaluation_users))}),
+    ]
+
+async def mcp_scenario(args, recorder: Recorder):
+    """
+    mcp-newarpのツールを同時に呼び出し、ツールごとの応答時間を計測する
+    """
+    tool_calls = create_tool_calls(args)
+    if args.tools:
+        tool_calls = [tool_call for tool_call in tool_calls if tool_call[0] in args.tools]
+
+    clients = [Client(args.mcp_url, timeout=args.timeout) for _ in range(args.mcp_concurrency)]
+    for client in clients:
+        await client.__aenter__()
+    try:
+        async def run_one(index: int):
+            tool_name, create_arguments = tool_calls[index % len(tool_calls)]
+            client = clients[index % len(clients)]
+            start_time = time.perf_counter()
+            try:
+                result = await client.call_tool(tool_name, create_arguments(), raise_on_error=False)
+                if result.is_error:
+                    raise RuntimeError(result.content)
+            except Exception as e:
+                recorder.record_error(tool_name, e)
+                return
+            recorder.record(tool_name, time.perf_counter() - start_time)
+
+        await run_workers(args.mcp_concurrency, args.mcp_requests, run_one)
+    finally:
+        for client in clients:
+            await client.__aexit__(None, None, None)
+
+def print_summary(title: str, rows: list, elapsed: float):
+    print(f"\n[{title}] 経過時間: {elapsed:.2f}秒")
+    print(f"{'計測項目':<36}{'件数':>8}{'エラー':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'最大(ms)':>10}{'件/秒':>10}")
+    for row in rows:
+        print(
+            f"{row['name']:<36}{row['count']:>8}{row['errors']:>8}"
+            f"{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}{row['p99'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}"
+            f"{row['throughput']:>10.2f}"
+        )
+
+async def main(args):
+    scenarios = {
+        "chat": [chat_scenario],
+        "mcp": [mcp_scenario],
+        "mixed": [chat_scenario, mcp_scenario],
+    }[args.scenario]
+
+    recorder = Recorder()
+    start_time = time.perf_counter()
+    await asyncio.gather(*[scenario(args, recorder) for scenario in scenarios])
+    elapsed = time.perf_counter() - start_time
+
+    rows = recorder.summary(elapsed)
+    print_summary(args.scenario, rows, elapsed)
+
+    if args.report:
+        report = {
+            "scenario": args.scenario,
+            "elapsed_seconds": elapsed,
+            "results": rows,
+            "errors": {name: errors[:10] for name, errors in recorder.errors.items()},
+        }
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="web-app・mcp-newarpに同時にリクエストを送り、応答時間の百分位数とスループットを計測する")
+    parser.add_argument("scenario", choices=["chat", "mcp", "mixed"], help="chat: /chat/stream、mcp: MCPツール、mixed: 両方を同時に実行")
+    parser.add_argument("--web-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--mcp-url", default="http://127.0.0.1:8081/mcp")
+    parser.add_argument("--chat-concurrency", type=int, default=20, help="/chat/streamの同時リクエスト数")
+    parser.add_argument("--chat-requests", type=int, default=200, help="/chat/streamの合計リクエスト数")
+    parser.add_argument("--distinct-questions", type=int, default=50, help="質問の種類数（少ないほど回答キャッシュ・相乗りが効く）")
+    parser.add_argument("--mcp-concurrency", type=int, default=10, help="MCPツールの同時呼び出し数")
+    parser.add_argument("--mcp-requests", type=int, default=500, help="MCPツールの合計呼び出し数")
+    parser.add_argument("--tools", nargs="+", help="呼び出すツール名（省略時はすべて）")
+    parser.add_argument("--evaluation-users", type=int, default=100, help="評価面談情報を取得する社員数（先頭から）")
+    parser.add_argument("--timeout", type=float, default=300, help="1リクエストのタイムアウト（秒）")
+    # fake_newarp.py と同じ値を指定する（存在する組織・社員を検索するため）
+    parser.add_argument("--divisions", type=int, default=5)
+    parser.add_argument("--departments", type=int, default=4)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--report", type=Path, help="結果をJSONで出力するファイル")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,185 @@
+from pathlib import Path
+import argparse
+import json
+import os
+import struct
+import time
+import uuid
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / "data"
+
+# キャッシュファイルの保存形式（msgpack または json）
+CACHE_FORMAT = os.getenv("NEWARP_CACHE_FORMAT", "msgpack" if msgpack is not None else "json")
+if CACHE_FORMAT == "msgpack" and msgpack is None:
+    raise ImportError("NEWARP_CACHE_FORMAT=msgpack を利用するには msgpack をインストールしてください")
+
+CACHE_EXT = ".msgpack" if CACHE_FORMAT == "msgpack" else ".json"
+
+def serialize(data, cache_format: str = CACHE_FORMAT) -> bytes:
+    if cache_format == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def deserialize(raw: bytes, cache_format: str = CACHE_FORMAT):
+    if cache_format == "msgpack":
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw)
+
+def get_cache_format(filepath) -> str:
+    return "msgpack" if str(filepath).endswith(".msgpack") else "json"
+
+def save_cache_file(data, save_filepath):
+    # 書き込み途中のファイルを読まれないよう一時ファイル経由で置き換える
+    tmp_filepath = f"{save_filepath}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_filepath, 'wb') as f:
+        f.write(serialize(data, get_cache_format(save_filepath)))
+    os.replace(tmp_filepath, save_filepath)
+
+def load_cache_file(filepath):
+    with open(filepath, 'rb') as f:
+        return deserialize(f.read(), get_cache_format(filepath))
+
+class CacheStreamWriter:
+    """
+    {"data": [...], ...} 形式のキャッシュファイルを、data配列の要素を1件ずつ追記しながら書き込む
+    書き込み中は一時ファイルに追記し、commit で置き換える（commitせずに閉じた場合は破棄する）
+    """
+    def __init__(self, save_filepath):
+        self._save_filepath = save_filepath
+        self._cache_format = get_cache_format(save_filepath)
+        self._tmp_filepath = f"{save_filepath}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_filepath, 'wb')
+        self._count = 0
+
+        if self._cache_format == "msgpack":
+            # 件数は書き込み完了時に確定するため、map32・array32のヘッダーを確保しておき最後に件数を書き込む
+            self._file.write(b"\xdf" + struct.pack(">I", 0) + serialize("data", "msgpack"))
+            self._array_header_offset = self._file.tell()
+            self._file.write(b"\xdd" + struct.pack(">I", 0))
+        else:
+            self._file.write(b'{"data":[')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._tmp_filepath)
+
+    def write_row(self, row):
+        if self._cache_format == "json" and self._count:
+            self._file.write(b",")
+        self._file.write(serialize(row, self._cache_format))
+        self._count += 1
+
+    def commit(self, extra: dict = None):
+        """
+        Args:
+            extra: data以外の最上位の項目
+        """
+        extra = {key: value for key, value in (extra or {}).items() if key != "data"}
+        if self._cache_format == "msgpack":
+            for key, value in extra.items():
+                self._file.write(serialize(key, "msgpack") + serialize(value, "msgpack"))
+            self._file.seek(1)
+            self._file.write(struct.pack(">I", 1 + len(extra)))
+            self._file.seek(self._array_header_offset + 1)
+            self._file.write(struct.pack(">I", self._count))
+        else:
+            self._file.write(b"]")
+            for key, value in extra.items():
+                self._file.write(b"," + serialize(key, "json") + b":" + serialize(value, "json"))
+            self._file.write(b"}")
+
+        self._file.close()
+        os.replace(self._tmp_filepath, self._save_filepath)
+
+def migrate(data_dir: Path, remove: bool):
+    """
+    data配下の既存JSONファイルを現在の保存形式に変換する（更新日時は引き継ぐ）
+    """
+    if CACHE_EXT == ".json":
+        print("保存形式がjsonのため変換は不要です")
+        return
+
+    count = 0
+    for json_file in sorted(data_dir.glob("*.json")):
+        if json_file.name.startswith("prefetch_progress"):
+            continue
+
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        stat = os.stat(json_file)
+        save_filepath = json_file.with_suffix(CACHE_EXT)
+        save_cache_file(data, save_filepath)
+        os.utime(save_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        if remove:
+            os.remove(json_file)
+        count += 1
+
+    print(f"変換件数: {count}")
+
+def benchmark(data_dir: Path, repeat: int):
+    """
+    data配下のキャッシュファイルについて、整形JSON・圧縮JSON・msgpackのサイズと読み込み時間を比較する
+    """
+    files = {}
+    for file in sorted(data_dir.glob("*.json")) + sorted(data_dir.glob("*.msgpack")):
+        if not file.name.startswith("prefetch_progress"):
+            files.setdefault(file.stem, file)
+    if not files:
+        print("data配下にキャッシュファイルがありません")
+        return
+
+    datasets = [load_cache_file(file) for file in files.values()]
+
+    formats = {
+        "json(indent=2)": (
+            lambda data: json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"),
+            lambda raw: json.loads(raw),
+        ),
+        "json(compact)": (
+            lambda data: serialize(data, "json"),
+            lambda raw: deserialize(raw, "json"),
+        ),
+    }
+    if msgpack is not None:
+        formats["msgpack"] = (
+            lambda data: serialize(data, "msgpack"),
+            lambda raw: deserialize(raw, "msgpack"),
+        )
+
+    print(f"対象ファイル数: {len(files)}, 繰り返し回数: {repeat}")
+    print(f"{'形式':<16}{'合計サイズ(bytes)':>20}{'読み込み時間(ms)':>20}")
+    for name, (dump, load) in formats.items():
+        raws = [dump(data) for data in datasets]
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            for raw in raws:
+                load(raw)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000 / repeat
+        print(f"{name:<16}{sum(len(raw) for raw in raws):>20}{elapsed_ms:>20.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="data配下のキャッシュファイルの保存形式を管理する")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="既存のJSONファイルを現在の保存形式に変換する")
+    migrate_parser.add_argument("--remove", action="store_true", help="変換後に元のJSONファイルを削除する")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="保存形式ごとのサイズと読み込み時間を比較する")
+    benchmark_parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(DATA_DIR, args.remove)
+    else:
+        benchmark(DATA_DIR, args.repeat)
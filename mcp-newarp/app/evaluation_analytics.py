@@ -0,0 +1,109 @@
+import numpy as np
+
+# 得点の区分（評価面談情報の項目名）
+SCORE_CATEGORIES = ["能力評価得点", "技術評価得点"]
+
+# 社員ごとに集計する指標
+METRIC_NAMES = [
+    "能力評価（自己）",
+    "能力評価（管理職）",
+    "技術評価（自己）",
+    "技術評価（管理職）",
+    "目標達成度(%)",
+    "自己評価と管理職評価の差",
+]
+
+def to_number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def extract_evaluation_values(record: dict) -> dict:
+    """
+    1評価年月分の評価面談情報から集計に使う値を取り出す
+
+    Returns:
+        score_categories・self_scores・manager_scores: 評価項目ごとの 区分番号・自己評価・管理職評価
+        achievements: 目標ごとの達成度
+    """
+    values = {"score_categories": [], "self_scores": [], "manager_scores": [], "achievements": []}
+    for category_index, category in enumerate(SCORE_CATEGORIES):
+        for score in record[category]:
+            values["score_categories"].append(category_index)
+            values["self_scores"].append(to_number(score["自己評価得点"]))
+            values["manager_scores"].append(to_number(score["管理職評価得点"]))
+    for goal in record["前期目標振り返り"]:
+        values["achievements"].append(to_number(goal["達成度(%)"]))
+    return values
+
+def grouped_mean(group_indexes: np.ndarray, values: np.ndarray, group_count: int) -> np.ndarray:
+    """
+    グループ番号ごとの平均値を求める（値がないグループはnan）
+    """
+    valid = ~np.isnan(values)
+    sums = np.bincount(group_indexes[valid], weights=values[valid], minlength=group_count)
+    counts = np.bincount(group_indexes[valid], minlength=group_count)
+    return np.divide(sums, counts, out=np.full(group_count, np.nan), where=counts > 0)
+
+def compute_user_metrics(columns: dict, user_count: int) -> dict:
+    """
+    社員ごとの指標（各区分の平均得点・目標達成度の平均・自己評価と管理職評価の差の平均）を求める
+    """
+    metrics = {}
+    for category_index, category_name in enumerate(["能力評価", "技術評価"]):
+        mask = columns["score_categories"] == category_index
+        metrics[f"{category_name}（自己）"] = grouped_mean(columns["score_users"][mask], columns["self_scores"][mask], user_count)
+        metrics[f"{category_name}（管理職）"] = grouped_mean(columns["score_users"][mask], columns["manager_scores"][mask], user_count)
+
+    metrics["目標達成度(%)"] = grouped_mean(columns["achievement_users"], columns["achievements"], user_count)
+    metrics["自己評価と管理職評価の差"] = grouped_mean(
+        columns["score_users"], columns["self_scores"] - columns["manager_scores"], user_count)
+    return metrics
+
+def compute_score_distribution(columns: dict) -> dict:
+    """
+    区分ごとに管理職評価得点の分布（得点 → 件数）を求める
+    """
+    distribution = {}
+    for category_index, category_name in enumerate(["能力評価", "技術評価"]):
+        scores = columns["manager_scores"][columns["score_categories"] == category_index]
+        scores = scores[~np.isnan(scores)]
+        values, counts = np.unique(scores, return_counts=True)
+        distribution[f"{category_name}（管理職）"] = {format_number(value): int(count) for value, count in zip(values, counts)}
+    return distribution
+
+def format_number(value) -> object:
+    """
+    結果に含める数値を整形する（nanはNone、整数値は整数、それ以外は小数第2位まで）
+    """
+    if value is None or np.isnan(value):
+        return None
+    if float(value).is_integer():
+        return int(value)
+    return round(float(value), 2)
+
+def rank_users(metric_values: np.ndarray, top: int, ascending: bool) -> list:
+    """
+    指標の値で社員番号を並べ替え、上位top件を返す（値がない社員は除く）
+    """
+    valid_indexes = np.flatnonzero(~np.isnan(metric_values))
+    valid_values = metric_values[valid_indexes]
+    # 同じ値の場合は元の順序を保つ
+    order = np.argsort(valid_values if ascending else -valid_values, kind="stable")
+    return valid_indexes[order[:top]].tolist()
+
+def summarize_by_unit(unit_indexes: np.ndarray, unit_count: int, metrics: dict, has_record: np.ndarray) -> list:
+    """
+    組織単位（部門・グループ）ごとに、評価のある社員数と各指標の平均を求める
+    """
+    evaluated_counts = np.bincount(unit_indexes[has_record], minlength=unit_count)
+    unit_metrics = {
+        name: grouped_mean(unit_indexes, values, unit_count)
+        for name, values in metrics.items()
+    }
+    return [
+        {"評価対象者数": int(evaluated_counts[unit_index]),
+         **{name: format_number(values[unit_index]) for name, values in unit_metrics.items()}}
+        for unit_index in range(unit_count)
+    ]
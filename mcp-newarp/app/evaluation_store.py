@@ -0,0 +1,285 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+import numpy as np
+from cache_format import CACHE_EXT, load_cache_file
+from master_store import DATA_DIR, get_evaluation_abc_file, get_fb_interview_sheet_file
+from evaluation_summary import build_evaluation_record
+from evaluation_analytics import extract_evaluation_values
+
+EVALUATION_STORE_FILE = DATA_DIR / "evaluation_store.npz"
+
+# 評価面談情報の取り込み（evaluation_store.py の実行時）に使うプロセス数（0はCPUコア数）
+EVALUATION_INGEST_WORKERS = int(os.getenv("NEWARP_EVALUATION_INGEST_WORKERS", "0")) or os.cpu_count() or 1
+
+# 読み込む件数がこれより少ない場合はプロセスを起動せずに読み込む（プロセスの起動に1秒程度かかるため）
+PARALLEL_INGEST_MIN_SOURCES = 1000
+
+FB_INTERVIEW_SHEET_PREFIX = "FB面談シート_"
+
+# 行の種類ごとの (読み込み元の番号の列, 社員番号の列, 値の列)
+ROW_GROUPS = [
+    ("score_sources", "score_users", ["score_categories", "self_scores", "manager_scores"]),
+    ("achievement_sources", "achievement_users", ["achievements"]),
+]
+
+COLUMN_DTYPES = {
+    "score_sources": np.int64,
+    "score_categories": np.int64,
+    "self_scores": np.float64,
+    "manager_scores": np.float64,
+    "achievement_sources": np.int64,
+    "achievements": np.float64,
+}
+
+def create_empty_columns() -> dict:
+    columns = {name: np.array([], dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+    # 読み込み元（社員 × 評価年月）ごとのキーと、FB面談シート・評価ABCの更新日時・サイズ
+    columns["source_user_keys"] = np.array([], dtype=str)
+    columns["source_year_months"] = np.array([], dtype=str)
+    columns["source_signatures"] = np.zeros((0, 4), dtype=np.int64)
+    return columns
+
+def get_source_signature(user_key: str, year_month: str):
+    """
+    FB面談シート・評価ABCの更新日時・サイズを返す（どちらかがない場合は None）
+    """
+    try:
+        fb_interview_sheet_stat = get_fb_interview_sheet_file(user_key, year_month).stat()
+        evaluation_abc_stat = get_evaluation_abc_file(user_key, year_month).stat()
+    except FileNotFoundError:
+        return None
+    return (
+        fb_interview_sheet_stat.st_mtime_ns, fb_interview_sheet_stat.st_size,
+        evaluation_abc_stat.st_mtime_ns, evaluation_abc_stat.st_size,
+    )
+
+def scan_evaluation_sources(sources: list = None) -> dict:
+    """
+    FB面談シート・評価ABCが揃っている (社員, 評価年月) と、両ファイルの更新日時・サイズを返す
+
+    Args:
+        sources: 確認する (社員, 評価年月) のリスト（省略時はdata配下をすべて走査する）
+    """
+    if sources is None:
+        sources = []
+        for fb_interview_sheet_file in DATA_DIR.glob(f"{FB_INTERVIEW_SHEET_PREFIX}*{CACHE_EXT}"):
+            user_key, _, year_month = fb_interview_sheet_file.name[len(FB_INTERVIEW_SHEET_PREFIX):-len(CACHE_EXT)].rpartition("_")
+            sources.append((user_key, year_month))
+    else:
+        sources = normalize_sources(sources)
+
+    signatures = {}
+    for user_key, year_month in sources:
+        signature = get_source_signature(user_key, year_month)
+        if signature is not None:
+            signatures[(user_key, year_month)] = signature
+    return signatures
+
+def normalize_sources(sources: list) -> list:
+    """
+    (社員, 評価年月) を保持している値と同じ文字列の組にそろえる（マスタのユーザキーは数値の場合がある）
+    """
+    return list(dict.fromkeys((str(user_key), str(year_month)) for user_key, year_month in sources))
+
+def parse_evaluation_source(source: tuple):
+    """
+    1件の (社員, 評価年月) のFB面談シート・評価ABCを読み込み、集計に使う値を取り出す（プロセスプールで実行される）
+    """
+    user_key, year_month = source
+    try:
+        record = build_evaluation_record(
+            load_cache_file(get_fb_interview_sheet_file(user_key, year_month)).get("data"),
+            load_cache_file(get_evaluation_abc_file(user_key, year_month)),
+        )
+        return extract_evaluation_values(record)
+    except Exception as e:
+        print(f"評価面談情報取り込みエラー: {user_key}_{year_month}: {e}", file=sys.stderr)
+        return None
+
+class EvaluationStore:
+    """
+    data配下の評価面談情報（FB面談シート・評価ABC）を列ごとの配列にまとめて保持する
+    更新日時・サイズが変わったファイルのみ読み込み、結果はファイルに保存して次回の起動時に再利用する
+    複数プロセスでの並列の読み込みは evaluation_store.py の実行時のみ行う（サーバー内ではプロセスを起動しない）
+    """
+    def __init__(self, store_file=EVALUATION_STORE_FILE, workers: int = 1):
+        self._store_file = store_file
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._columns = None
+
+    def _load(self) -> dict:
+        columns = create_empty_columns()
+        if not os.path.isfile(self._store_file):
+            return columns
+
+        try:
+            with np.load(self._store_file, allow_pickle=False) as stored:
+                if set(stored.files) == set(columns):
+                    return {name: stored[name] for name in stored.files}
+        except Exception as e:
+            print(f"評価面談情報の集計ファイル読み込みエラー（作り直します）: {e}", file=sys.stderr)
+        return columns
+
+    def reload(self):
+        """
+        別プロセス（evaluation_store.py）で更新された集計ファイルを読み込み直す
+        """
+        with self._lock:
+            self._columns = self._load()
+
+    def _save(self, columns: dict):
+        # 書き込み途中のファイルを読まれないよう一時ファイル経由で置き換える
+        tmp_filepath = f"{self._store_file}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_filepath, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_filepath, self._store_file)
+
+    def _parse(self, sources: list) -> list:
+        if len(sources) < PARALLEL_INGEST_MIN_SOURCES or self._workers <= 1:
+            return [parse_evaluation_source(source) for source in sources]
+
+        # サーバーのスレッドやロックを引き継がないよう、forkではなくspawnでプロセスを起動する
+        with ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            chunksize = max(1, len(sources) // (self._workers * 4))
+            return list(executor.map(parse_evaluation_source, sources, chunksize=chunksize))
+
+    def update(self, sources: list = None) -> dict:
+        """
+        追加・更新されたファイルを取り込み、削除されたファイルの値を除く
+
+        Args:
+            sources: 確認する (社員, 評価年月) のリスト（省略時はdata配下をすべて走査する。
+                ツールの呼び出しごとに大量のファイルを走査しないよう、取得した範囲のみ指定する）
+        """
+        with self._lock:
+            if self._columns is None:
+                self._columns = self._load()
+            columns = self._columns
+
+            old_sources = {
+                source: index
+                for index, source in enumerate(zip(columns["source_user_keys"].tolist(), columns["source_year_months"].tolist()))
+            }
+            if sources is None:
+                checked_sources = old_sources
+                kept_indexes = []
+            else:
+                # 確認しない読み込み元の値はそのまま残す
+                sources = normalize_sources(sources)
+                checked_sources = {source: old_sources[source] for source in sources if source in old_sources}
+                checked_indexes = set(checked_sources.values())
+                kept_indexes = [index for index in old_sources.values() if index not in checked_indexes]
+
+            parse_sources = []
+            signatures = scan_evaluation_sources(sources)
+            for source, signature in signatures.items():
+                index = checked_sources.get(source)
+                if index is not None and tuple(columns["source_signatures"][index].tolist()) == signature:
+                    kept_indexes.append(index)
+                else:
+                    parse_sources.append(source)
+
+            summary = {"sources": len(signatures), "parsed": 0, "failed": 0, "removed": len(old_sources) - len(kept_indexes)}
+            if not parse_sources and not summary["removed"]:
+                return summary
+
+            parsed = [
+                (source, values)
+                for source, values in zip(parse_sources, self._parse(parse_sources))
+                if values is not None
+            ]
+            summary["parsed"] = len(parsed)
+            summary["failed"] = len(parse_sources) - len(parsed)
+
+            self._columns = merge_columns(columns, sorted(kept_indexes), parse_sources, parsed, signatures)
+            self._save(self._columns)
+            summary["removed"] = len(set(old_sources) - set(zip(
+                self._columns["source_user_keys"].tolist(), self._columns["source_year_months"].tolist())))
+            return summary
+
+    def get_columns(self, user_keys: list, year_month: str) -> tuple:
+        """
+        指定した社員・評価年月の値を、社員番号（user_keysでの位置）付きの列ごとの配列で返す
+
+        Returns:
+            (列ごとの配列, 社員ごとに評価があるかどうかの配列)
+        """
+        if self._columns is None:
+            self.reload()
+        columns = self._columns
+
+        user_indexes = {str(user_key): index for index, user_key in enumerate(user_keys)}
+        source_users = np.array(
+            [user_indexes.get(user_key, -1) for user_key in columns["source_user_keys"].tolist()], dtype=np.int64)
+        source_users[columns["source_year_months"] != year_month] = -1
+
+        has_record = np.zeros(len(user_keys), dtype=bool)
+        has_record[source_users[source_users >= 0]] = True
+
+        result = {}
+        for source_column, user_column, value_columns in ROW_GROUPS:
+            row_users = source_users[columns[source_column]]
+            mask = row_users >= 0
+            result[user_column] = row_users[mask]
+            for value_column in value_columns:
+                result[value_column] = columns[value_column][mask]
+        return result, has_record
+
+def merge_columns(columns: dict, kept_indexes: list, parse_sources: list, parsed: list, signatures: dict) -> dict:
+    """
+    残す読み込み元の値と、新たに読み込んだ値をつなげて新しい列ごとの配列を作る
+    （読み込み直した読み込み元の古い値は、kept_indexes に含まれていても除いて重複させない）
+    """
+    parse_source_set = set(parse_sources)
+    kept_indexes = [
+        index for index in kept_indexes
+        if (columns["source_user_keys"][index], columns["source_year_months"][index]) not in parse_source_set
+    ]
+    source_map = np.full(len(columns["source_user_keys"]), -1, dtype=np.int64)
+    source_map[kept_indexes] = np.arange(len(kept_indexes))
+    new_sources = [
+        *zip(columns["source_user_keys"][kept_indexes].tolist(), columns["source_year_months"][kept_indexes].tolist()),
+        *[source for source, _ in parsed],
+    ]
+
+    merged = {
+        "source_user_keys": np.array([user_key for user_key, _ in new_sources], dtype=str),
+        "source_year_months": np.array([year_month for _, year_month in new_sources], dtype=str),
+        "source_signatures": np.concatenate([
+            columns["source_signatures"][kept_indexes],
+            np.array([signatures[source] for source, _ in parsed], dtype=np.int64).reshape(-1, 4),
+        ]),
+    }
+    for source_column, _, value_columns in ROW_GROUPS:
+        new_row_sources = source_map[columns[source_column]]
+        mask = new_row_sources >= 0
+        parts = {source_column: [new_row_sources[mask]]}
+        for value_column in value_columns:
+            parts[value_column] = [columns[value_column][mask]]
+
+        for source_index, (_, values) in enumerate(parsed, start=len(kept_indexes)):
+            parts[source_column].append(np.full(len(values[value_columns[0]]), source_index, dtype=np.int64))
+            for value_column in value_columns:
+                parts[value_column].append(np.array(values[value_column], dtype=COLUMN_DTYPES[value_column]))
+
+        for name, arrays in parts.items():
+            merged[name] = np.concatenate(arrays).astype(COLUMN_DTYPES[name], copy=False)
+    return merged
+
+EVALUATION_STORE = EvaluationStore()
+
+def main():
+    start_time = time.perf_counter()
+    summary = EvaluationStore(workers=EVALUATION_INGEST_WORKERS).update()
+    summary["elapsed_seconds"] = round(time.perf_counter() - start_time, 1)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import os
+import threading
+from master_store import get_evaluation_abc_file, get_fb_interview_sheet_file, get_file_signature
+from newarp_cache import NEWARP_CACHE
+
+# メモリ上に保持する（社員 × 評価年月）の評価面談情報の件数
+EVALUATION_SUMMARY_CACHE_SIZE = int(os.getenv("NEWARP_EVALUATION_SUMMARY_CACHE_SIZE", "4096"))
+
+def build_score_rows(evaluation_abc_data: dict, include) -> list:
+    """
+    自己評価の行ごとに、同じ評価項目（evaluationKindId）の管理職評価を結合する
+
+    Args:
+        include: 対象とする自己評価の行を判定する関数
+    """
+    not_self_by_kind = {row["evaluationKindId"]: row for row in evaluation_abc_data.get("dataNotSelf") or []}
+
+    score_rows = []
+    for evaluation_self in evaluation_abc_data.get("data") or []:
+        if not include(evaluation_self) or not evaluation_self["itemPoints"]:
+            continue
+
+        evaluation_not_self = not_self_by_kind.get(evaluation_self["evaluationKindId"], {})
+        score_rows.append({
+            "スキル種類": evaluation_self.get("groupName", ""),
+            "スキル名": evaluation_self.get("evaluationKind", ""),
+            "自己評価得点": evaluation_self.get("itemPoints", ""),
+            "管理職評価得点": evaluation_not_self.get("itemPoints", "")
+        })
+    return score_rows
+
+def build_evaluation_record(fb_interview_sheet_data: dict, evaluation_abc_data: dict) -> dict:
+    """
+    FB面談シートと評価ABCから1評価年月分の評価面談情報を作成する
+    """
+    info = fb_interview_sheet_data.get("info")
+
+    result_data = {}
+    result_data["評価年月"] = info.get("periodName")
+
+    fb_interview = {}
+    fb_interview["将来のあるべき姿"] = info.get("vision")
+    fb_interview["アピールポイント"] = info.get("appeal")
+    fb_interview["会社へ一言"] = info.get("note")
+    fb_interview["技術分類"] = info.get("evaluationKind")
+    fb_interview["評価ステージ"] = info.get("evaluationStage")
+    fb_interview["評価クラス"] = info.get("evaluationClass")
+    fb_interview["管理職からの期待"] = info.get("expectation")
+    result_data["評価全体情報"] = fb_interview
+
+    past_goals = []
+    for past_goal in fb_interview_sheet_data.get("pastDetails"):
+        past_goals.append({
+            "目標": past_goal.get("goal", ""),
+            "達成条件": past_goal.get("condition", ""),
+            "達成度(%)": past_goal.get("assessment", ""),
+            "実行結果コメント": past_goal.get("comment", ""),
+            "管理職からのコメント": past_goal.get("assessmentComment", ""),
+        })
+    result_data["前期目標振り返り"] = past_goals
+
+    next_goals = []
+    for next_goal in fb_interview_sheet_data.get("pastDetails"):
+        next_goals.append({
+            "目標": next_goal.get("goal", ""),
+            "達成条件": next_goal.get("condition", ""),
+        })
+    result_data["来季目標"] = next_goals
+
+    result_data["能力評価得点"] = build_score_rows(
+        evaluation_abc_data, lambda row: row["groupName"] not in ("業績考課", "技術考課"))
+    result_data["技術評価得点"] = build_score_rows(
+        evaluation_abc_data, lambda row: row["groupName"] == "技術考課")
+    return result_data
+
+class EvaluationSummaryCache:
+    """
+    (社員, 評価年月)ごとに組み立て済みの評価面談情報を保持する
+    元のファイル（FB面談シート・評価ABC）の更新日時・サイズが変わった場合は作り直す
+    """
+    def __init__(self, max_size: int = EVALUATION_SUMMARY_CACHE_SIZE):
+        self._max_size = max_size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_key, year_month: str) -> dict:
+        fb_interview_sheet_file = get_fb_interview_sheet_file(user_key, year_month)
+        evaluation_abc_file = get_evaluation_abc_file(user_key, year_month)
+        key = (str(user_key), year_month)
+        version = get_file_signature([fb_interview_sheet_file, evaluation_abc_file])
+
+        with self._lock:
+            cached = self._records.get(key)
+            if cached is not None and cached[0] == version:
+                self._records.move_to_end(key)
+                return cached[1]
+
+        record = build_evaluation_record(
+            NEWARP_CACHE.load(fb_interview_sheet_file).get("data"),
+            NEWARP_CACHE.load(evaluation_abc_file),
+        )
+
+        with self._lock:
+            self._records[key] = (version, record)
+            self._records.move_to_end(key)
+            while len(self._records) > self._max_size:
+                self._records.popitem(last=False)
+        return record
+
+EVALUATION_SUMMARY_CACHE = EvaluationSummaryCache()
@@ -0,0 +1,53 @@
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+class DataArrayParser:
+    """
+    {"data": [...], ...} 形式のJSONを受信したバイト列から順に解析し、data配列の要素を1件ずつ取り出す
+    data以外の最上位の項目は extra に保持する
+    """
+    def __init__(self):
+        if ijson is None:
+            raise ImportError("JSONを逐次解析するには ijson をインストールしてください")
+
+        self._events = ijson.sendable_list()
+        self._coroutine = ijson.parse_coro(self._events, use_float=True)
+        self._builder = None
+        self.extra = {}
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        受信したバイト列を解析し、完成したdata配列の要素を返す
+        """
+        self._coroutine.send(chunk)
+        return self._drain()
+
+    def close(self) -> list:
+        self._coroutine.close()
+        return self._drain()
+
+    def _drain(self) -> list:
+        rows = []
+        for prefix, event, value in self._events:
+            # 最上位のオブジェクトとdata配列自体の開始・終了は読み飛ばす
+            if prefix == "" or (prefix == "data" and event in ("start_array", "end_array")):
+                continue
+
+            path = "data.item" if prefix == "data.item" or prefix.startswith("data.item.") else prefix.split(".", 1)[0]
+            if self._builder is None:
+                self._builder = ObjectBuilder()
+            self._builder.event(event, value)
+
+            # 要素（またはdata以外の項目）の値が完成した
+            if prefix == path and event not in ("start_map", "start_array", "map_key"):
+                if path == "data.item":
+                    rows.append(self._builder.value)
+                elif path != "data":
+                    self.extra[path] = self._builder.value
+                self._builder = None
+
+        del self._events[:]
+        return rows
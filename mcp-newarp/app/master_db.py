@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import threading
+from master_store import *
+from name_index import NAME_NORMALIZE, normalize_name
+
+MASTER_DB_FILE = DATA_DIR / "master.db"
+
+ORGANIZATION_FILES = [DIVISION_MASTER_FILE, DEPARTMENT_MASTER_FILE, GROUP_MASTER_FILE]
+USER_FILES = [USER_MASTER_FILE]
+
+# 社員名検索用に正規化したユーザ名の列（NEWARP_NAME_NORMALIZE=1 の場合に検索に使う）
+SEARCH_NAME_COLUMN = "検索用ユーザ名"
+USER_TABLE_COLUMNS = USER_COLUMNS + [SEARCH_NAME_COLUMN]
+
+def build_user_table_rows(user_data: list) -> list:
+    return [{**row, SEARCH_NAME_COLUMN: normalize_name(row["ユーザ名"] or "")} for row in build_user_rows(user_data)]
+
+def quote_columns(columns: list) -> str:
+    return ", ".join(f'"{column}"' for column in columns)
+
+class SqliteMasterBackend:
+    """
+    マスタをSQLiteに取り込み、索引付きのクエリで検索する
+    マスタファイルの更新日時・サイズが変わり、かつ内容も変わった場合のみテーブルを再作成する
+    """
+    def __init__(self, db_file=MASTER_DB_FILE):
+        self._connection = sqlite3.connect(db_file, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._signatures = {}
+
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS organizations (row_no INTEGER PRIMARY KEY, {quote_columns(ORGANIZATION_COLUMNS)})")
+            # 検索用の列がない以前のテーブルは作り直す
+            user_table_columns = [row["name"] for row in self._connection.execute("PRAGMA table_info(users)")]
+            if user_table_columns and SEARCH_NAME_COLUMN not in user_table_columns:
+                self._connection.execute("DROP TABLE users")
+                self._connection.execute("DELETE FROM meta WHERE key = 'users'")
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS users (row_no INTEGER PRIMARY KEY, {quote_columns(USER_TABLE_COLUMNS)})")
+            self._connection.execute('CREATE INDEX IF NOT EXISTS idx_organizations_division ON organizations ("事業部短縮名")')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS idx_organizations_department ON organizations ("部門短縮名")')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS idx_organizations_group ON organizations ("グループ短縮名")')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS idx_users_user_key ON users ("ユーザキー")')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS idx_users_group ON users ("グループ短縮名")')
+
+    def _sync(self, table: str, files: list, columns: list, build_rows):
+        signature = json.dumps(get_file_signature(files), ensure_ascii=False)
+        if self._signatures.get(table) == signature:
+            return
+
+        with self._lock, self._connection:
+            digest = get_file_digest(files)
+            stored = self._connection.execute("SELECT value FROM meta WHERE key = ?", (table,)).fetchone()
+            if stored is None or stored["value"] != digest:
+                rows = build_rows(*[load_master_rows(file) for file in files])
+                self._connection.execute(f"DELETE FROM {table}")
+                self._connection.executemany(
+                    f"INSERT INTO {table} ({quote_columns(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [[row[column] for column in columns] for row in rows],
+                )
+                self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (table, digest))
+            self._signatures[table] = signature
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(sql, parameters)]
+
+    def load_organizations(self):
+        self._sync("organizations", ORGANIZATION_FILES, ORGANIZATION_COLUMNS, build_organization_rows)
+
+    def load_users(self):
+        self._sync("users", USER_FILES, USER_TABLE_COLUMNS, build_user_table_rows)
+
+    def refresh(self):
+        self.load_organizations()
+        self.load_users()
+
+    def get_organizations(self, column: str = None, value: str = None) -> list:
+        self.load_organizations()
+        if column is None:
+            return self._query(f"SELECT {quote_columns(ORGANIZATION_COLUMNS)} FROM organizations ORDER BY row_no")
+        return self._query(f'SELECT {quote_columns(ORGANIZATION_COLUMNS)} FROM organizations WHERE "{column}" = ? ORDER BY row_no', (value,))
+
+    def get_users(self, column: str = None, value: str = None) -> list:
+        self.load_users()
+        if column is None:
+            return self._query(f"SELECT {quote_columns(USER_COLUMNS)} FROM users ORDER BY row_no")
+        return self._query(f'SELECT {quote_columns(USER_COLUMNS)} FROM users WHERE "{column}" = ? ORDER BY row_no', (value,))
+
+    def search_users(self, userName: str) -> list:
+        self.load_users()
+        # メモリ上の索引（NameIndex）と同じく、正規化する場合は正規化した名前どうしで部分一致させる
+        if NAME_NORMALIZE:
+            return self._query(
+                f'SELECT {quote_columns(USER_COLUMNS)} FROM users WHERE instr("{SEARCH_NAME_COLUMN}", ?) > 0 ORDER BY row_no',
+                (normalize_name(userName),),
+            )
+        return self._query(f'SELECT {quote_columns(USER_COLUMNS)} FROM users WHERE instr("ユーザ名", ?) > 0 ORDER BY row_no', (userName,))
+
+    def get_users_in_organization(self, column: str, value: str) -> list:
+        self.load_organizations()
+        self.load_users()
+        user_columns = ", ".join(f'u."{column}"' for column in USER_COLUMNS)
+        return self._query(
+            f'SELECT {user_columns} FROM organizations o JOIN users u ON u."グループ短縮名" = o."グループ短縮名" '
+            f'WHERE o."{column}" = ? ORDER BY o.row_no, u.row_no',
+            (value,),
+        )
+
+    def count_users_per_department(self, divisionShortName: str = None) -> list:
+        self.load_organizations()
+        self.load_users()
+        where = 'WHERE o."事業部短縮名" = ?' if divisionShortName else ""
+        return self._query(
+            f'SELECT o."事業部短縮名", o."部門短縮名", o."部門名", COUNT(u.row_no) AS "社員数" '
+            f'FROM organizations o LEFT JOIN users u ON u."グループ短縮名" = o."グループ短縮名" '
+            f'{where} GROUP BY o."事業部コード", o."部門コード" '
+            f'ORDER BY (SELECT MIN(d.row_no) FROM organizations d WHERE d."事業部コード" = o."事業部コード"), MIN(o.row_no)',
+            (divisionShortName,) if divisionShortName else (),
+        )
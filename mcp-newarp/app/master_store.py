@@ -0,0 +1,327 @@
+from pathlib import Path
+import hashlib
+import os
+import threading
+from cache_format import CACHE_EXT, load_cache_file
+from name_index import NameIndex
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / "data"
+
+DIVISION_MASTER_FILE = DATA_DIR / ("事業部マスタ" + CACHE_EXT)
+DEPARTMENT_MASTER_FILE = DATA_DIR / ("部門マスタ" + CACHE_EXT)
+GROUP_MASTER_FILE = DATA_DIR / ("課マスタ" + CACHE_EXT)
+USER_MASTER_FILE = DATA_DIR / ("ユーザマスタ" + CACHE_EXT)
+
+def get_fb_interview_sheet_file(user_key, year_month: str) -> Path:
+    return DATA_DIR / ("FB面談シート_" + str(user_key) + "_" + year_month + CACHE_EXT)
+
+def get_evaluation_abc_file(user_key, year_month: str) -> Path:
+    return DATA_DIR / ("評価ABC_" + str(user_key) + "_" + year_month + CACHE_EXT)
+
+ORGANIZATION_COLUMNS = [
+    "事業部コード", "事業部名", "事業部短縮名",
+    "部門コード", "部門名", "部門短縮名",
+    "グループコード", "グループ名", "グループ短縮名"
+]
+
+USER_COLUMNS = [
+    "ユーザキー", "ユーザID", "ユーザ名", "メールアドレス", "グループ短縮名", "役職", "入社日"
+]
+
+def get_file_signature(files: list) -> tuple:
+    """
+    ファイルの更新日時とサイズから変更検知用のシグネチャを作成する
+    """
+    signature = []
+    for file in files:
+        stat = os.stat(file)
+        signature.append((str(file), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def get_file_digest(files: list) -> str:
+    """
+    ファイルの内容のハッシュ値を作成する（更新日時のみ変わった場合に作り直しを省くため）
+    """
+    digest = hashlib.sha1()
+    for file in files:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def load_master_rows(filepath) -> list:
+    return load_cache_file(filepath).get("data")
+
+def build_organization_rows(division_data: list, department_data: list, group_data: list) -> list:
+    division_map = {d["divisionCode"]: d for d in division_data}
+    department_map = {d["departmentCode"]: d for d in department_data}
+
+    rows = []
+    for group in group_data:
+        department = department_map.get(group["departmentCode"], {})
+        division = division_map.get(department.get("divisionCode"), {})
+
+        rows.append({
+            # 事業部
+            "事業部コード": division.get("divisionCode", ""),
+            "事業部名": division.get("divisionName", ""),
+            "事業部短縮名": division.get("divisionShortName", ""),
+
+            # 部門
+            "部門コード": department.get("departmentCode", ""),
+            "部門名": department.get("departmentName", ""),
+            "部門短縮名": department.get("departmentShortName", ""),
+
+            # 課
+            "グループコード": group.get("groupCode", ""),
+            "グループ名": group.get("groupName", ""),
+            "グループ短縮名": group.get("groupShortName", "")
+        })
+    return rows
+
+def build_user_row(user: dict) -> dict:
+    return {
+        "ユーザキー": user.get("userKey", ""),
+        "ユーザID": user.get("userId", ""),
+        "ユーザ名": user.get("userName", ""),
+        "メールアドレス": user.get("mailAddress", ""),
+        "グループ短縮名": user.get("groupShortName", ""),
+        "役職": user.get("position", ""),
+        "入社日": user.get("joiningDate", "")
+    }
+
+def build_user_rows(user_data: list) -> list:
+    return [build_user_row(user) for user in user_data]
+
+def build_organization_tree(rows: list) -> list:
+    """
+    事業部 → 部門 → グループの木構造を作成する
+    各ノードは配下の組織マスタ行（rows）を持つため、検索時に結合や抽出をせずそのまま返せる
+    """
+    divisions = {}
+    for row in rows:
+        division = divisions.get(row["事業部コード"])
+        if division is None:
+            division = divisions[row["事業部コード"]] = {
+                "事業部コード": row["事業部コード"],
+                "事業部名": row["事業部名"],
+                "事業部短縮名": row["事業部短縮名"],
+                "rows": [],
+                "departments": {},
+            }
+        division["rows"].append(row)
+
+        department = division["departments"].get(row["部門コード"])
+        if department is None:
+            department = division["departments"][row["部門コード"]] = {
+                "部門コード": row["部門コード"],
+                "部門名": row["部門名"],
+                "部門短縮名": row["部門短縮名"],
+                "rows": [],
+                "groups": [],
+            }
+        department["rows"].append(row)
+
+        department["groups"].append({
+            "グループコード": row["グループコード"],
+            "グループ名": row["グループ名"],
+            "グループ短縮名": row["グループ短縮名"],
+            "rows": [row],
+        })
+
+    tree = list(divisions.values())
+    for division in tree:
+        division["departments"] = list(division["departments"].values())
+    return tree
+
+def build_organization_slices(tree: list) -> dict:
+    """
+    短縮名 → 配下の組織マスタ行 の対応表を木構造のノードから作成する
+    """
+    slices = {"事業部短縮名": {}, "部門短縮名": {}, "グループ短縮名": {}}
+
+    def add_slice(column: str, node: dict):
+        if node[column] in slices[column]:
+            # 短縮名が重複する場合のみ行を連結する
+            slices[column][node[column]] = slices[column][node[column]] + node["rows"]
+        else:
+            slices[column][node[column]] = node["rows"]
+
+    for division in tree:
+        add_slice("事業部短縮名", division)
+        for department in division["departments"]:
+            add_slice("部門短縮名", department)
+            for group in department["groups"]:
+                add_slice("グループ短縮名", group)
+    return slices
+
+def build_organization_snapshot(division_file, department_file, group_file) -> dict:
+    rows = build_organization_rows(
+        load_master_rows(division_file),
+        load_master_rows(department_file),
+        load_master_rows(group_file),
+    )
+    tree = build_organization_tree(rows)
+
+    return {
+        "columns": ORGANIZATION_COLUMNS,
+        "data": rows,
+        "tree": tree,
+        "slices": build_organization_slices(tree),
+    }
+
+USER_INDEX_COLUMNS = ["ユーザキー", "グループ短縮名"]
+
+class UserSnapshotBuilder:
+    """
+    ユーザマスタの要素を1件ずつ受け取り、索引を更新しながらスナップショットを組み立てる
+    （ユーザマスタの受信中に索引を作成できるよう、download_user_master の row_handler に add を渡す）
+    """
+    def __init__(self):
+        self._rows = []
+        self._indexes = {column: {} for column in USER_INDEX_COLUMNS}
+        self._name_index = NameIndex([], "ユーザ名")
+
+    def add(self, user: dict):
+        row = build_user_row(user)
+        self._rows.append(row)
+        for column, index in self._indexes.items():
+            index.setdefault(row[column], []).append(row)
+        self._name_index.add(row)
+
+    def build(self) -> dict:
+        return {
+            "columns": USER_COLUMNS,
+            "data": self._rows,
+            "indexes": self._indexes,
+            "name_index": self._name_index,
+        }
+
+def build_user_snapshot(user_file) -> dict:
+    builder = UserSnapshotBuilder()
+    for user in load_master_rows(user_file):
+        builder.add(user)
+    return builder.build()
+
+class MasterStore:
+    """
+    マスタファイルを一度だけ読み込み、索引付きのスナップショットとしてプロセス内で共有する
+    ファイルの更新日時・サイズが変わり、かつ内容も変わった場合のみ再構築する
+    """
+    def __init__(self, files: list, builder):
+        self._files = files
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._signature = None
+        self._digest = None
+        self._snapshot = None
+        self._refreshing = False
+
+    def _update(self):
+        signature = get_file_signature(self._files)
+        if self._snapshot is not None and signature == self._signature:
+            return
+
+        digest = get_file_digest(self._files)
+        if self._snapshot is None or digest != self._digest:
+            self._snapshot = self._builder(*self._files)
+            self._digest = digest
+        self._signature = signature
+
+    def get(self) -> dict:
+        signature = get_file_signature(self._files)
+        snapshot = self._snapshot
+        # 再構築中は以前のスナップショットを返す
+        if snapshot is not None and (signature == self._signature or self._refreshing):
+            return snapshot
+
+        with self._lock:
+            self._update()
+            return self._snapshot
+
+    def refresh(self):
+        """
+        マスタファイルを置き換えた後に呼び出し、検索を止めずに再構築して差し替える
+        """
+        with self._lock:
+            self._refreshing = True
+            try:
+                self._update()
+            finally:
+                self._refreshing = False
+
+    def install(self, snapshot: dict):
+        """
+        マスタファイルの取得時に組み立て済みのスナップショットを、ファイルを読み直さずに差し替える
+        """
+        with self._lock:
+            self._snapshot = snapshot
+            self._signature = get_file_signature(self._files)
+            self._digest = get_file_digest(self._files)
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = None
+            self._digest = None
+            self._snapshot = None
+
+ORGANIZATION_STORE = MasterStore(
+    [DIVISION_MASTER_FILE, DEPARTMENT_MASTER_FILE, GROUP_MASTER_FILE],
+    build_organization_snapshot,
+)
+
+USER_STORE = MasterStore([USER_MASTER_FILE], build_user_snapshot)
+
+class MemoryMasterBackend:
+    """
+    マスタをメモリ上の索引から検索する（既定のバックエンド）
+    """
+    def load_organizations(self):
+        ORGANIZATION_STORE.get()
+
+    def load_users(self):
+        USER_STORE.get()
+
+    def refresh(self):
+        ORGANIZATION_STORE.refresh()
+        USER_STORE.refresh()
+
+    def get_organizations(self, column: str = None, value: str = None) -> list:
+        snapshot = ORGANIZATION_STORE.get()
+        if column is None:
+            return snapshot["data"]
+        return snapshot["slices"][column].get(value, [])
+
+    def get_users(self, column: str = None, value: str = None) -> list:
+        snapshot = USER_STORE.get()
+        if column is None:
+            return snapshot["data"]
+        return snapshot["indexes"][column].get(value, [])
+
+    def search_users(self, userName: str) -> list:
+        return USER_STORE.get()["name_index"].search(userName)
+
+    def get_users_in_organization(self, column: str, value: str) -> list:
+        users_by_group = USER_STORE.get()["indexes"]["グループ短縮名"]
+
+        result_data = []
+        for organization in self.get_organizations(column, value):
+            result_data.extend(users_by_group.get(organization["グループ短縮名"], []))
+        return result_data
+
+    def count_users_per_department(self, divisionShortName: str = None) -> list:
+        users_by_group = USER_STORE.get()["indexes"]["グループ短縮名"]
+
+        result_data = []
+        for division in ORGANIZATION_STORE.get()["tree"]:
+            if divisionShortName and division["事業部短縮名"] != divisionShortName:
+                continue
+            for department in division["departments"]:
+                result_data.append({
+                    "事業部短縮名": division["事業部短縮名"],
+                    "部門短縮名": department["部門短縮名"],
+                    "部門名": department["部門名"],
+                    "社員数": sum(len(users_by_group.get(group["グループ短縮名"], [])) for group in department["groups"]),
+                })
+        return result_data
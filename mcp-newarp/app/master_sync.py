@@ -0,0 +1,123 @@
+from pathlib import Path
+import asyncio
+import json
+import os
+import sys
+import time
+from newarp_access import *
+from master_store import *
+from newarp_cache import *
+
+# マスタを定期的に再取得する間隔（秒、0は定期同期しない）
+MASTER_SYNC_INTERVAL = int(os.getenv("NEWARP_MASTER_SYNC_INTERVAL", "0"))
+
+# マスタファイルと、行を識別するキー
+MASTER_SYNC_TARGETS = [
+    ("事業部", dewonload_division_master, DIVISION_MASTER_FILE, "divisionCode"),
+    ("部門", dewonload_department_master, DEPARTMENT_MASTER_FILE, "departmentCode"),
+    ("グループ", dewonload_group_master, GROUP_MASTER_FILE, "groupCode"),
+    ("ユーザ", download_user_master, USER_MASTER_FILE, "userKey"),
+]
+
+def get_sync_filepath(filepath: Path) -> Path:
+    return filepath.with_name(filepath.stem + ".sync" + filepath.suffix)
+
+def diff_rows(old_rows: list, new_rows: list, key: str) -> dict:
+    """
+    キーが同じ行どうしを比較し、追加・削除・変更された行のキーを返す
+    """
+    old_map = {row.get(key): row for row in old_rows}
+    new_map = {row.get(key): row for row in new_rows}
+    return {
+        "added": [row_key for row_key in new_map if row_key not in old_map],
+        "removed": [row_key for row_key in old_map if row_key not in new_map],
+        "changed": [row_key for row_key, row in new_map.items() if row_key in old_map and old_map[row_key] != row],
+    }
+
+def has_changes(diff: dict) -> bool:
+    return any(diff.values())
+
+def get_evaluation_files(user_key) -> list:
+    return [
+        file
+        for pattern in [f"FB面談シート_{user_key}_*{CACHE_EXT}", f"評価ABC_{user_key}_*{CACHE_EXT}"]
+        for file in DATA_DIR.glob(pattern)
+    ]
+
+def invalidate_evaluation_cache(user_diff: dict) -> int:
+    """
+    削除された社員の評価面談情報は破棄し、変更された社員の評価面談情報は次回利用時に再取得させる
+    """
+    count = 0
+    for user_key in user_diff["removed"]:
+        for file in get_evaluation_files(user_key):
+            NEWARP_CACHE.discard(file)
+            file.unlink(missing_ok=True)
+            count += 1
+
+    # 古いデータを返しつつ裏で再取得される状態（stale）にする
+    stale_time = time.time() - EVALUATION_CACHE_TTL - 1
+    for user_key in user_diff["changed"]:
+        for file in get_evaluation_files(user_key):
+            os.utime(file, (stale_time, stale_time))
+            count += 1
+    return count
+
+async def sync_masters(client: NewarpClient, backend=None) -> dict:
+    """
+    マスタを再取得して前回との差分を求め、変更があったマスタのみ置き換える
+    索引は内容が変わったマスタのみ再構築し、影響を受ける社員の評価面談情報のキャッシュのみ無効にする
+
+    Args:
+        backend: 置き換え後に索引を再構築するマスタの検索方法（省略時は次回の検索時に再構築される）
+    """
+    diffs = {}
+    sync_files = []
+    try:
+        for name, download_function, filepath, key in MASTER_SYNC_TARGETS:
+            sync_filepath = get_sync_filepath(filepath)
+            sync_files.append((sync_filepath, filepath))
+            await download_function(client, sync_filepath)
+
+            old_rows = load_master_rows(filepath) if os.path.isfile(filepath) else []
+            diffs[name] = diff_rows(old_rows, load_master_rows(sync_filepath), key)
+
+        # すべて取得できてから置き換える（途中で失敗した場合は以前のマスタのまま）
+        for (sync_filepath, filepath), diff in zip(sync_files, diffs.values()):
+            if has_changes(diff) or not os.path.isfile(filepath):
+                os.replace(sync_filepath, filepath)
+            else:
+                # 内容が同じ場合は取得日時のみ更新する
+                os.utime(filepath)
+    finally:
+        for sync_filepath, _ in sync_files:
+            if os.path.isfile(sync_filepath):
+                os.remove(sync_filepath)
+
+    if backend is not None:
+        await asyncio.to_thread(backend.refresh)
+
+    return {
+        "diffs": {name: {kind: len(keys) for kind, keys in diff.items()} for name, diff in diffs.items()},
+        "invalidated_evaluation_files": invalidate_evaluation_cache(diffs["ユーザ"]),
+    }
+
+async def run_sync_loop(client: NewarpClient, backend, interval: int = MASTER_SYNC_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            summary = await sync_masters(client, backend)
+            print(f"マスタ同期: {json.dumps(summary, ensure_ascii=False)}", file=sys.stderr)
+        except Exception as e:
+            print(f"マスタ同期エラー: {e}", file=sys.stderr)
+
+async def main():
+    try:
+        # 索引はmcp-newarpのサーバーが次回の検索時に再構築する
+        summary = await sync_masters(NEWARP_CLIENT)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    finally:
+        await NEWARP_CLIENT.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
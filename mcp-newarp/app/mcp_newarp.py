@@ -1,122 +1,200 @@
 from fastmcp import FastMCP
-from pathlib import Path
-import json
-import requests
+from contextlib import asynccontextmanager
+import asyncio
+import functools
 import os
 import sys
+import numpy as np
 from newarp_access import *
+from master_store import *
+from newarp_cache import *
+from master_db import SqliteMasterBackend
+from metrics import ToolMetricsMiddleware, metrics_endpoint
+from tool_result import paginate_result
+from master_sync import MASTER_SYNC_INTERVAL, run_sync_loop
+from evaluation_summary import EVALUATION_SUMMARY_CACHE
+from evaluation_analytics import *
+from evaluation_store import EVALUATION_STORE
+from warmup import Warmup, WarmupMiddleware
 
-BASE_DIR = Path(__file__).resolve().parent
+# 起動時にNeWarpへのログイン・マスタの取得・索引の作成を裏で行う（0: 最初のツール呼び出し時に行う）
+WARMUP_ON_STARTUP = os.getenv("NEWARP_WARMUP_ON_STARTUP", "1") == "1"
 
-with open(BASE_DIR / 'config' / 'logininfo.json', 'r', encoding='utf-8') as f:
-    NEWARP_USER_INFO = json.load(f)
+@asynccontextmanager
+async def lifespan(server):
+    # サーバーの起動を待たせないよう、準備は裏で実行する
+    if WARMUP_ON_STARTUP:
+        WARMUP.start()
 
-mcp = FastMCP("NeWarp MCP Server")
-
-def get_company_organization_data() -> dict:
+    # マスタを定期的に再取得し、差分のあったマスタのみ置き換える
+    sync_task = asyncio.create_task(run_sync_loop(NEWARP_CLIENT, MASTER_BACKEND)) if MASTER_SYNC_INTERVAL > 0 else None
     try:
-        required_files = [
-            BASE_DIR / "data" / "事業部マスタ.json",
-            BASE_DIR / "data" / "部門マスタ.json",
-            BASE_DIR / "data" / "課マスタ.json",
-        ]
-        if any(not os.path.isfile(f) for f in required_files):
-            with requests.Session() as session:
-                login_newarp(session)
-                dewonload_division_master(session, required_files[0])
-                dewonload_department_master(session, required_files[1])
-                dewonload_group_master(session, required_files[2])
+        yield
+    finally:
+        WARMUP.stop()
+        if sync_task is not None:
+            sync_task.cancel()
 
-        with open(required_files[0], 'r', encoding='utf-8') as f:
-            division_data = json.load(f).get("data")
+mcp = FastMCP("NeWarp MCP Server", lifespan=lifespan)
 
-        with open(required_files[1], 'r', encoding='utf-8') as f:
-            department_data = json.load(f).get("data")
+# ツールごとの処理時間を計測し、/metrics でPrometheus形式で公開する
+mcp.add_middleware(ToolMetricsMiddleware())
+mcp.custom_route("/metrics", methods=["GET"])(metrics_endpoint)
 
-        with open(required_files[2], 'r', encoding='utf-8') as f:
-            group_data = json.load(f).get("data")
+# 評価情報の同時ダウンロード数
+EVALUATION_DOWNLOAD_CONCURRENCY = int(os.getenv("NEWARP_DOWNLOAD_CONCURRENCY", "5"))
 
-        division_map = {d["divisionCode"]: d for d in division_data}
-        department_map = {d["departmentCode"]: d for d in department_data}
+# マスタの検索方法（memory: メモリ上の索引、sqlite: SQLite）
+MASTER_BACKEND = SqliteMasterBackend() if os.getenv("NEWARP_MASTER_BACKEND", "memory") == "sqlite" else MemoryMasterBackend()
 
-        result_data = []
-        for group in group_data:
-            department_code = group["departmentCode"]
-            department = department_map.get(department_code, {})
-
-            division_code = department["divisionCode"]
-            division = division_map.get(division_code, {})
-
-            result_data.append({
-                # 事業部
-                "事業部コード": division.get("divisionCode", ""),
-                "事業部名": division.get("divisionName", ""),
-                "事業部短縮名": division.get("divisionShortName", ""),
-
-                # 部門
-                "部門コード": department.get("departmentCode", ""),
-                "部門名": department.get("departmentName", ""),
-                "部門短縮名": department.get("departmentShortName", ""),
-
-                # 課
-                "グループコード": group.get("groupCode", ""),
-                "グループ名": group.get("groupName", ""),
-                "グループ短縮名": group.get("groupShortName", "")
-            })
-
-        columns = [
-            "事業部コード", "事業部名", "事業部短縮名",
-            "部門コード", "部門名", "部門短縮名",
-            "グループコード", "グループ名", "グループ短縮名"
-        ]
+# 評価の集計ツールで一度に対象とする最大社員数
+ANALYTICS_MAX_USERS = int(os.getenv("NEWARP_ANALYTICS_MAX_USERS", "1000"))
 
-        return {
-            "columns": columns,
-            "data": result_data,
-        }
+# 評価の集計ツールで未取得の評価面談情報の取得を待つ最大秒数（超えた分は裏で取得を続け、取得済みの社員のみ集計する）
+ANALYTICS_DOWNLOAD_WAIT = float(os.getenv("NEWARP_ANALYTICS_DOWNLOAD_WAIT", "10"))
+
+# 裏で実行中の評価面談情報の取得（GCで破棄されないよう参照を保持する）
+evaluation_download_tasks = set()
+
+async def ensure_organization_files():
+    await asyncio.gather(
+        NEWARP_CACHE.ensure(DIVISION_MASTER_FILE, MASTER_CACHE_TTL,
+                            functools.partial(dewonload_division_master, NEWARP_CLIENT, DIVISION_MASTER_FILE)),
+        NEWARP_CACHE.ensure(DEPARTMENT_MASTER_FILE, MASTER_CACHE_TTL,
+                            functools.partial(dewonload_department_master, NEWARP_CLIENT, DEPARTMENT_MASTER_FILE)),
+        NEWARP_CACHE.ensure(GROUP_MASTER_FILE, MASTER_CACHE_TTL,
+                            functools.partial(dewonload_group_master, NEWARP_CLIENT, GROUP_MASTER_FILE)),
+    )
+
+async def get_company_organization_data() -> dict:
+    try:
+        await ensure_organization_files()
+
+        MASTER_BACKEND.load_organizations()
+        return {"columns": ORGANIZATION_COLUMNS}
     except Exception as e:
         print(f"会社組織情報取得エラー: {e}", file=sys.stderr)
         return {"error": str(e)}
     
-def get_user_data() -> dict:
+async def ensure_evaluation_files(user_keys: list, year_months: list, return_exceptions: bool = False) -> list:
     """
-    Args:
-        userName: 検索したい社員名（部分一致）
+    (社員 × 評価年月 × 帳票)のキャッシュを同時実行数を制限して並列に取得・更新する
+
+    Returns:
+        社員ごとの結果（return_exceptions=True の場合、取得に失敗した社員は例外）
     """
-    try:
-        user_master_file = BASE_DIR / "data" / "ユーザマスタ.json"
-        if not os.path.isfile(user_master_file):
-            with requests.Session() as session:
-                login_newarp(session)
-                download_user_master(session, user_master_file)
+    semaphore = asyncio.Semaphore(EVALUATION_DOWNLOAD_CONCURRENCY)
 
-        with open(user_master_file, 'r', encoding='utf-8') as f:
-            user_data = json.load(f).get("data")
+    async def download(download_function, save_filepath, user_key: str, year_month: str):
+        async with semaphore:
+            await download_function(NEWARP_CLIENT, save_filepath, user_key, year_month)
 
-        columns = [
-            "ユーザキー", "ユーザID", "ユーザ名", "メールアドレス", "グループ短縮名", "役職", "入社日"
-        ]
+    async def ensure_user(user_key: str):
+        tasks = []
+        for year_month in year_months:
+            for download_function, save_filepath in [
+                (download_fb_interview_sheet, get_fb_interview_sheet_file(user_key, year_month)),
+                (download_evaluation_abc, get_evaluation_abc_file(user_key, year_month)),
+            ]:
+                tasks.append(NEWARP_CACHE.ensure(
+                    save_filepath, EVALUATION_CACHE_TTL,
+                    functools.partial(download, download_function, save_filepath, user_key, year_month),
+                ))
+        await asyncio.gather(*tasks)
 
-        result_data = []
-        for user in user_data:
-            result_data.append({
-                "ユーザキー": user.get("userKey", ""),
-                "ユーザID": user.get("userId", ""),
-                "ユーザ名": user.get("userName", ""),
-                "メールアドレス": user.get("mailAddress", ""),
-                "グループ短縮名": user.get("groupShortName", ""),
-                "役職": user.get("position", ""),
-                "入社日": user.get("joiningDate", "")
-            })
+    return await asyncio.gather(*[ensure_user(user_key) for user_key in user_keys], return_exceptions=return_exceptions)
 
-        return {
-            "columns": columns,
-            "data": result_data,
-        }
+def get_uncached_evaluation_users(user_keys: list, year_month: str) -> list:
+    """
+    指定した評価年月のFB面談シート・評価ABCのキャッシュがまだない社員を返す
+    """
+    return [
+        user_key for user_key in user_keys
+        if not (os.path.isfile(get_fb_interview_sheet_file(user_key, year_month))
+                and os.path.isfile(get_evaluation_abc_file(user_key, year_month)))
+    ]
+
+async def ensure_evaluation_files_within(user_keys: list, year_month: str, timeout: float) -> list:
+    """
+    評価面談情報の取得を最大timeout秒待つ（終わらなかった分は裏で取得を続ける。取得に失敗した社員は評価なしとして扱う）
+
+    Returns:
+        待ち時間内に取得できなかった社員
+    """
+    task = asyncio.ensure_future(ensure_evaluation_files(user_keys, [year_month], return_exceptions=True))
+    evaluation_download_tasks.add(task)
+    task.add_done_callback(evaluation_download_tasks.discard)
+
+    await asyncio.wait([task], timeout=timeout)
+    if task.done():
+        return []
+    return await asyncio.to_thread(get_uncached_evaluation_users, user_keys, year_month)
+
+async def download_user_master_with_index(client: NewarpClient, save_filepath):
+    """
+    ユーザマスタを受信しながら索引を作成し、受信後はファイルを読み直さずに差し替える
+    """
+    builder = UserSnapshotBuilder()
+    await download_user_master(client, save_filepath, builder.add)
+    USER_STORE.install(builder.build())
+
+async def ensure_user_file():
+    # SQLiteの場合はファイルから取り込むため、受信中の索引作成は行わない
+    download_function = download_user_master_with_index if isinstance(MASTER_BACKEND, MemoryMasterBackend) else download_user_master
+    await NEWARP_CACHE.ensure(USER_MASTER_FILE, MASTER_CACHE_TTL,
+                              functools.partial(download_function, NEWARP_CLIENT, USER_MASTER_FILE))
+
+async def get_user_data() -> dict:
+    try:
+        await ensure_user_file()
+
+        MASTER_BACKEND.load_users()
+        return {"columns": USER_COLUMNS}
     except Exception as e:
         print(f"ユーザ情報取得エラー: {e}", file=sys.stderr)
         return {"error": str(e)}
     
+async def get_user_organization_data() -> dict:
+    organization_response = await get_company_organization_data()
+    if "error" in organization_response:
+        return organization_response
+    return await get_user_data()
+
+async def warm_up_masters():
+    await asyncio.gather(ensure_organization_files(), ensure_user_file())
+    # 索引の作成はイベントループを止めないよう別スレッドで行う
+    await asyncio.to_thread(MASTER_BACKEND.refresh)
+
+async def ingest_evaluation_store():
+    """
+    data配下の評価面談情報を別プロセス（evaluation_store.py）で取り込み、結果を読み込み直す
+    （複数プロセスでの読み込みがサーバーのモジュールを読み込まないよう、サーバーの外で実行する）
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluation_store.py"))
+    try:
+        return_code = await process.wait()
+    except asyncio.CancelledError:
+        # サーバーの停止時は取り込みも止める
+        process.kill()
+        raise
+    if return_code != 0:
+        raise RuntimeError(f"evaluation_store.py が終了コード {return_code} で終了しました")
+    await asyncio.to_thread(EVALUATION_STORE.reload)
+
+WARMUP = Warmup(
+    [
+        ("NeWarpへのログイン", NEWARP_CLIENT.login),
+        ("マスタの取得・索引の作成", warm_up_masters),
+    ],
+    # 評価の集計用の取り込みは時間がかかることがあるため、ツール呼び出しを待たせずに行う
+    [("評価面談情報の取り込み", ingest_evaluation_store)],
+)
+
+# 準備中に呼ばれたツールは準備の完了を待ち、/ready で準備の状況を公開する
+mcp.add_middleware(WarmupMiddleware(WARMUP))
+mcp.custom_route("/ready", methods=["GET"])(WARMUP.readiness_endpoint)
+
 @mcp.tool(
     name="get_company_organization_master",
     description=(
@@ -128,12 +206,26 @@ def get_user_data() -> dict:
         "例: '会社の組織構成を教えて', 'どんな事業部があるか一覧で見たい'"
     )
 )
-def get_company_organization_master() -> dict:
-    result = get_company_organization_data()
+async def get_company_organization_master(
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_company_organization_data()
     if "error" in result:
         return result
 
-    return {
+    return paginate_result({
             "report_title": "会社組織情報",
             "description": (
                 "これは会社全体の組織情報です。"
@@ -145,8 +237,8 @@ def get_company_organization_master() -> dict:
                 "全体構造の説明が求められている場合は、上位から順に分かりやすく文章でまとめてください。"
             ),
             "columns": result["columns"],
-            "data": result["data"],
-        }
+            "data": MASTER_BACKEND.get_organizations(),
+        }, limit, offset, columns, compact, continuationToken)
     
 @mcp.tool(
     name="get_division_master",
@@ -158,37 +250,45 @@ def get_company_organization_master() -> dict:
         "例: '営業事業部にはどんな部門がある？', 'BSS事業部の組織構成を教えて'"
     )
 )
-def get_division_master(divisionShortName: str) -> dict:
+async def get_division_master(
+    divisionShortName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
     """
     Args:
         divisionShortName: 検索対象の事業部短縮名（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
     """
-    result = get_company_organization_data()
+    result = await get_company_organization_data()
     if "error" in result:
         return result
     
-    all_data = result["data"]
-    result_data = []
-    for data in all_data:
-        if data["事業部短縮名"] == divisionShortName:
-            result_data.append(data)
+    result_data = MASTER_BACKEND.get_organizations("事業部短縮名", divisionShortName)
 
     if not result_data:
-        return {
+        return paginate_result({
             "report_title": "事業部情報",
             "description": "指定された事業部は見つかりませんでした。",
             "analysis_instruction": "該当する事業部が存在しないことをユーザーに伝えてください。",
             "columns": result["columns"],
             "data": [],
-        }
+        }, limit, offset, columns, compact, continuationToken)
 
-    return {
+    return paginate_result({
             "report_title": "事業部情報",
             "description": "これは指定された事業部の情報です。事業部→部門→グループの構造を表しています。",
             "analysis_instruction": "質問で求められている情報を文章で回答してください。",
             "columns": result["columns"],
             "data": result_data,
-        }
+        }, limit, offset, columns, compact, continuationToken)
     
 @mcp.tool(
     name="get_department_master",
@@ -200,37 +300,45 @@ def get_division_master(divisionShortName: str) -> dict:
         "例: '営業部にはどんなグループがある？', 'BSS部門はどの事業部？'"
     )
 )
-def get_department_master(departmentShortName: str) -> dict:
+async def get_department_master(
+    departmentShortName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
     """
     Args:
         departmentShortName: 検索対象の部門短縮名（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
     """
-    result = get_company_organization_data()
+    result = await get_company_organization_data()
     if "error" in result:
         return result
     
-    all_data = result["data"]
-    result_data = []
-    for data in all_data:
-        if data["部門短縮名"] == departmentShortName:
-            result_data.append(data)
+    result_data = MASTER_BACKEND.get_organizations("部門短縮名", departmentShortName)
 
     if not result_data:
-        return {
+        return paginate_result({
             "report_title": "部門情報",
             "description": "指定された部門は見つかりませんでした。",
             "analysis_instruction": "該当する部門が存在しないことをユーザーに伝えてください。",
             "columns": result["columns"],
             "data": [],
-        }
+        }, limit, offset, columns, compact, continuationToken)
 
-    return {
+    return paginate_result({
             "report_title": "部門情報",
             "description": "これは指定された部門の情報です。事業部→部門→グループの構造を表しています。",
             "analysis_instruction": "質問で求められている情報を文章で回答してください。",
             "columns": result["columns"],
             "data": result_data,
-        }
+        }, limit, offset, columns, compact, continuationToken)
     
 @mcp.tool(
     name="get_group_master",
@@ -242,37 +350,45 @@ def get_department_master(departmentShortName: str) -> dict:
         "例: 'BSSグループはどの部門？', '○○グループの所属事業部を教えて'"
     )
 )
-def get_group_master(groupShortName: str) -> dict:
+async def get_group_master(
+    groupShortName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
     """
     Args:
         groupShortName: 検索対象のグループ短縮名（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
     """
-    result = get_company_organization_data()
+    result = await get_company_organization_data()
     if "error" in result:
         return result
     
-    all_data = result["data"]
-    result_data = []
-    for data in all_data:
-        if data["グループ短縮名"] == groupShortName:
-            result_data.append(data)
+    result_data = MASTER_BACKEND.get_organizations("グループ短縮名", groupShortName)
 
     if not result_data:
-        return {
+        return paginate_result({
             "report_title": "グループ情報",
             "description": "指定されたグループは見つかりませんでした。",
             "analysis_instruction": "該当するグループが存在しないことをユーザーに伝えてください。",
             "columns": result["columns"],
             "data": [],
-        }
+        }, limit, offset, columns, compact, continuationToken)
 
-    return {
+    return paginate_result({
             "report_title": "グループ情報",
             "description": "これは指定されたグループの情報です。事業部→部門→グループの構造を表しています。",
             "analysis_instruction": "質問で求められている情報を文章で回答してください。",
             "columns": result["columns"],
             "data": result_data,
-        }
+        }, limit, offset, columns, compact, continuationToken)
 
 @mcp.tool(
     name="get_user_master_user_name",
@@ -284,37 +400,45 @@ def get_group_master(groupShortName: str) -> dict:
         "例: '山田太郎のメールアドレスは？', '佐藤という名前の社員一覧を出して'"
     )
 )
-def get_user_master_user_name(userName: str) -> dict:
+async def get_user_master_user_name(
+    userName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
     """
     Args:
         userName: 検索したい社員名（部分一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
     """
-    result = get_user_data()
+    result = await get_user_data()
     if "error" in result:
         return result
     
-    all_data = result["data"]
-    result_data = []
-    for data in all_data:
-        if userName in data["ユーザ名"]:
-            result_data.append(data)
+    result_data = MASTER_BACKEND.search_users(userName)
 
     if not result_data:
-        return {
+        return paginate_result({
             "report_title": "ユーザ情報",
             "description": "該当する社員が見つかりませんでした。",
             "analysis_instruction": "該当者がいない旨をユーザーに伝えてください。",
             "columns": result["columns"],
             "data": [],
-        }
+        }, limit, offset, columns, compact, continuationToken)
 
-    return {
+    return paginate_result({
         "report_title": "ユーザ情報",
         "description": "これはユーザ情報です。",
         "analysis_instruction": "質問で求められている情報を文章で回答してください。",
         "columns": result["columns"],
         "data": result_data,
-    }
+    }, limit, offset, columns, compact, continuationToken)
 
 @mcp.tool(
     name="get_user_master_group_short_name",
@@ -325,37 +449,393 @@ def get_user_master_user_name(userName: str) -> dict:
         "例: 'BTIに所属する社員一覧を出して'"
     )
 )
-def get_user_master_group_short_name(groupShortName: str) -> dict:
+async def get_user_master_group_short_name(
+    groupShortName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
     """
     Args:
         group_short_name: 検索対象のグループ短縮名（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
     """
-    result = get_user_data()
+    result = await get_user_data()
     if "error" in result:
         return result
     
-    all_data = result["data"]
-    result_data = []
-    for data in all_data:
-        if groupShortName == data.get("グループ短縮名"):
-            result_data.append(data)
+    result_data = MASTER_BACKEND.get_users("グループ短縮名", groupShortName)
 
     if not result_data:
-        return {
+        return paginate_result({
             "report_title": "ユーザ情報",
             "description": "該当する社員が見つかりませんでした。",
             "analysis_instruction": "該当者がいない旨をユーザーに伝えてください。",
             "columns": result["columns"],
             "data": [],
-        }
+        }, limit, offset, columns, compact, continuationToken)
 
-    return {
+    return paginate_result({
         "report_title": "ユーザ情報",
         "description": "これはユーザ情報です。",
         "analysis_instruction": "質問で求められている情報を文章で回答してください。",
         "columns": result["columns"],
         "data": result_data,
-    }
+    }, limit, offset, columns, compact, continuationToken)
+
+@mcp.tool(
+    name="get_user_master_division_short_name",
+    description=(
+        "社員（ユーザ）情報を検索して返すツールです。"
+        "事業部短縮名（divisionShortName）をもとに、事業部配下の全グループに所属する社員を検索します。"
+        "事業部に所属する社員の氏名、メールアドレス、所属グループ、役職などを知りたい質問のときに使用してください。"
+        "例: 'BSS事業部に所属する社員一覧を出して'"
+    )
+)
+async def get_user_master_division_short_name(
+    divisionShortName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        divisionShortName: 検索対象の事業部短縮名（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_user_organization_data()
+    if "error" in result:
+        return result
+
+    result_data = MASTER_BACKEND.get_users_in_organization("事業部短縮名", divisionShortName)
+
+    if not result_data:
+        return paginate_result({
+            "report_title": "ユーザ情報",
+            "description": "該当する社員が見つかりませんでした。",
+            "analysis_instruction": "該当者がいない旨をユーザーに伝えてください。",
+            "columns": result["columns"],
+            "data": [],
+        }, limit, offset, columns, compact, continuationToken)
+
+    return paginate_result({
+        "report_title": "ユーザ情報",
+        "description": "これは指定された事業部に所属するユーザ情報です。",
+        "analysis_instruction": "質問で求められている情報を文章で回答してください。",
+        "columns": result["columns"],
+        "data": result_data,
+    }, limit, offset, columns, compact, continuationToken)
+
+@mcp.tool(
+    name="get_user_master_department_short_name",
+    description=(
+        "社員（ユーザ）情報を検索して返すツールです。"
+        "部門短縮名（departmentShortName）をもとに、部門配下の全グループに所属する社員を検索します。"
+        "部門に所属する社員の氏名、メールアドレス、所属グループ、役職などを知りたい質問のときに使用してください。"
+        "例: '営業部に所属する社員一覧を出して'"
+    )
+)
+async def get_user_master_department_short_name(
+    departmentShortName: str,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        departmentShortName: 検索対象の部門短縮名（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_user_organization_data()
+    if "error" in result:
+        return result
+
+    result_data = MASTER_BACKEND.get_users_in_organization("部門短縮名", departmentShortName)
+
+    if not result_data:
+        return paginate_result({
+            "report_title": "ユーザ情報",
+            "description": "該当する社員が見つかりませんでした。",
+            "analysis_instruction": "該当者がいない旨をユーザーに伝えてください。",
+            "columns": result["columns"],
+            "data": [],
+        }, limit, offset, columns, compact, continuationToken)
+
+    return paginate_result({
+        "report_title": "ユーザ情報",
+        "description": "これは指定された部門に所属するユーザ情報です。",
+        "analysis_instruction": "質問で求められている情報を文章で回答してください。",
+        "columns": result["columns"],
+        "data": result_data,
+    }, limit, offset, columns, compact, continuationToken)
+
+@mcp.tool(
+    name="get_department_user_count",
+    description=(
+        "部門ごとの社員数を集計して返すツールです。"
+        "事業部短縮名（divisionShortName）を指定するとその事業部配下の部門のみ、省略すると全部門を集計します。"
+        "部門の人数や人数の多い部門を知りたい質問のときに使用してください。"
+        "例: 'BSS事業部の部門ごとの人数は？', '一番人数が多い部門はどこ？'"
+    )
+)
+async def get_department_user_count(
+    divisionShortName: str = "",
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        divisionShortName: 集計対象の事業部短縮名（完全一致、省略時は全事業部）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_user_organization_data()
+    if "error" in result:
+        return result
+
+    result_data = MASTER_BACKEND.count_users_per_department(divisionShortName)
+
+    if not result_data:
+        return paginate_result({
+            "report_title": "部門別社員数",
+            "description": "指定された事業部は見つかりませんでした。",
+            "analysis_instruction": "該当する事業部が存在しないことをユーザーに伝えてください。",
+            "columns": ["事業部短縮名", "部門短縮名", "部門名", "社員数"],
+            "data": [],
+        }, limit, offset, columns, compact, continuationToken)
+
+    return paginate_result({
+        "report_title": "部門別社員数",
+        "description": "これは部門ごとの社員数です。",
+        "analysis_instruction": "質問で求められている情報を文章で回答してください。",
+        "columns": ["事業部短縮名", "部門短縮名", "部門名", "社員数"],
+        "data": result_data,
+    }, limit, offset, columns, compact, continuationToken)
+
+def search_each(values: list, search) -> dict:
+    """
+    検索条件ごとに検索し、{検索条件: 該当行}の形にまとめる（同じ検索条件は1回だけ検索する）
+    """
+    return {value: search(value) for value in dict.fromkeys(values or [])}
+
+def get_not_found_description(grouped_results: dict) -> str:
+    not_found = [value for results in grouped_results.values() for value, rows in results.items() if not rows]
+    if not not_found:
+        return ""
+    return f"次の検索条件に該当するデータは見つかりませんでした: {', '.join(not_found)}"
+
+@mcp.tool(
+    name="get_organization_masters",
+    description=(
+        "複数の事業部・部門・グループの組織情報を1回でまとめて取得するツールです。"
+        "事業部短縮名（divisionShortNames）、部門短縮名（departmentShortNames）、グループ短縮名（groupShortNames）をそれぞれリストで指定します。"
+        "結果は検索条件ごとにまとめて返します。"
+        "複数の組織について知りたい質問では、get_division_master・get_department_master・get_group_master を繰り返し呼ばずにこのツールを使用してください。"
+        "例: 'BSSとBTIはそれぞれどの部門？', '営業事業部と開発事業部の組織構成を比べて'"
+    )
+)
+async def get_organization_masters(
+    divisionShortNames: list[str] | None = None,
+    departmentShortNames: list[str] | None = None,
+    groupShortNames: list[str] | None = None,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        divisionShortNames: 検索対象の事業部短縮名のリスト（完全一致）
+        departmentShortNames: 検索対象の部門短縮名のリスト（完全一致）
+        groupShortNames: 検索対象のグループ短縮名のリスト（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_company_organization_data()
+    if "error" in result:
+        return result
+
+    grouped_results = {}
+    for column, values in [
+        ("事業部短縮名", divisionShortNames),
+        ("部門短縮名", departmentShortNames),
+        ("グループ短縮名", groupShortNames),
+    ]:
+        if values:
+            grouped_results[column] = search_each(values, functools.partial(MASTER_BACKEND.get_organizations, column))
+
+    return paginate_result({
+        "report_title": "組織情報（複数）",
+        "description": (
+            "これは指定された組織ごとの情報です。検索条件の種類（事業部短縮名・部門短縮名・グループ短縮名）→ 検索条件 → 該当行 の形でまとめています。"
+            + get_not_found_description(grouped_results)
+        ),
+        "analysis_instruction": "検索条件ごとに質問で求められている情報を文章で回答してください。見つからなかった組織があればその旨も伝えてください。",
+        "columns": result["columns"],
+        "data": grouped_results,
+    }, limit, offset, columns, compact, continuationToken)
+
+@mcp.tool(
+    name="get_user_master_user_names",
+    description=(
+        "複数の社員（ユーザ）情報を1回でまとめて検索するツールです。"
+        "社員名のリスト（userNames）を指定し、それぞれ部分一致で検索します。"
+        "結果は社員名ごとにまとめて返します。"
+        "複数の社員について知りたい質問では、get_user_master_user_name を繰り返し呼ばずにこのツールを使用してください。"
+        "例: '山田太郎と佐藤花子のメールアドレスは？', '鈴木と高橋の所属グループを教えて'"
+    )
+)
+async def get_user_master_user_names(
+    userNames: list[str],
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        userNames: 検索したい社員名のリスト（部分一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_user_data()
+    if "error" in result:
+        return result
+
+    grouped_results = {"社員名": search_each(userNames, MASTER_BACKEND.search_users)}
+
+    return paginate_result({
+        "report_title": "ユーザ情報（複数）",
+        "description": "これは社員名ごとのユーザ情報です。社員名 → 該当行 の形でまとめています。" + get_not_found_description(grouped_results),
+        "analysis_instruction": "社員名ごとに質問で求められている情報を文章で回答してください。該当者がいない社員名があればその旨も伝えてください。",
+        "columns": result["columns"],
+        "data": grouped_results["社員名"],
+    }, limit, offset, columns, compact, continuationToken)
+
+@mcp.tool(
+    name="get_user_master_group_short_names",
+    description=(
+        "複数のグループに所属する社員（ユーザ）情報を1回でまとめて検索するツールです。"
+        "グループ短縮名のリスト（groupShortNames）を指定します。"
+        "結果はグループごとにまとめて返します。"
+        "複数のグループの所属社員を知りたい質問では、get_user_master_group_short_name を繰り返し呼ばずにこのツールを使用してください。"
+        "例: 'BTIとBSSに所属する社員一覧を出して'"
+    )
+)
+async def get_user_master_group_short_names(
+    groupShortNames: list[str],
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        groupShortNames: 検索対象のグループ短縮名のリスト（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_user_data()
+    if "error" in result:
+        return result
+
+    grouped_results = {"グループ短縮名": search_each(groupShortNames, functools.partial(MASTER_BACKEND.get_users, "グループ短縮名"))}
+
+    return paginate_result({
+        "report_title": "ユーザ情報（複数）",
+        "description": "これはグループごとのユーザ情報です。グループ短縮名 → 該当行 の形でまとめています。" + get_not_found_description(grouped_results),
+        "analysis_instruction": "グループごとに質問で求められている情報を文章で回答してください。該当者がいないグループがあればその旨も伝えてください。",
+        "columns": result["columns"],
+        "data": grouped_results["グループ短縮名"],
+    }, limit, offset, columns, compact, continuationToken)
+
+@mcp.tool(
+    name="get_users_in_organizations",
+    description=(
+        "複数の事業部・部門に所属する社員（ユーザ）情報を1回でまとめて検索するツールです。"
+        "事業部短縮名（divisionShortNames）、部門短縮名（departmentShortNames）をそれぞれリストで指定し、配下の全グループに所属する社員を返します。"
+        "結果は事業部・部門ごとにまとめて返します。"
+        "複数の事業部・部門の所属社員を知りたい質問では、get_user_master_division_short_name・get_user_master_department_short_name を繰り返し呼ばずにこのツールを使用してください。"
+        "例: 'BSS事業部と営業部に所属する社員一覧を出して'"
+    )
+)
+async def get_users_in_organizations(
+    divisionShortNames: list[str] | None = None,
+    departmentShortNames: list[str] | None = None,
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        divisionShortNames: 検索対象の事業部短縮名のリスト（完全一致）
+        departmentShortNames: 検索対象の部門短縮名のリスト（完全一致）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    result = await get_user_organization_data()
+    if "error" in result:
+        return result
+
+    grouped_results = {}
+    for column, values in [
+        ("事業部短縮名", divisionShortNames),
+        ("部門短縮名", departmentShortNames),
+    ]:
+        if values:
+            grouped_results[column] = search_each(values, functools.partial(MASTER_BACKEND.get_users_in_organization, column))
+
+    return paginate_result({
+        "report_title": "ユーザ情報（複数）",
+        "description": (
+            "これは指定された事業部・部門ごとに所属するユーザ情報です。検索条件の種類（事業部短縮名・部門短縮名）→ 検索条件 → 該当行 の形でまとめています。"
+            + get_not_found_description(grouped_results)
+        ),
+        "analysis_instruction": "事業部・部門ごとに質問で求められている情報を文章で回答してください。該当者がいない組織があればその旨も伝えてください。",
+        "columns": result["columns"],
+        "data": grouped_results,
+    }, limit, offset, columns, compact, continuationToken)
 
 @mcp.tool(
     name="get_user_evaluation",
@@ -367,18 +847,17 @@ def get_user_master_group_short_name(groupShortName: str) -> dict:
         "例: '山田太郎の何が得意？', '佐藤のキャリアプランは何？', '佐藤のスキルは何が得意？'"
     )
 )
-def get_user_evaluation(userName: str) -> dict:
+async def get_user_evaluation(userName: str) -> dict:
     """
     Args:
         userName: 検索したい社員名（部分一致）
     """
     try:
-        user_response = get_user_data()
+        user_response = await get_user_data()
         if "error" in user_response:
             return user_response
         
-        user_all_data = user_response["data"]
-        user_result_data = [user_data for user_data in user_all_data if userName in user_data["ユーザ名"]]
+        user_result_data = MASTER_BACKEND.search_users(userName)
 
         if not user_result_data:
             return {
@@ -401,91 +880,10 @@ def get_user_evaluation(userName: str) -> dict:
         user_name = user_result_data[0].get("ユーザ名")
 
         inverview_year_months = NEWARP_USER_INFO["FB_INTERVIEW_YEAR_MONTH"]
-        all_result_data = []
-        for year_month in inverview_year_months:
-            fb_interview_sheet_file = BASE_DIR / "data" / ("FB面談シート_" + str(user_key) + "_" + year_month + ".json")
-            if not os.path.isfile(fb_interview_sheet_file):
-                with requests.Session() as session:
-                    login_newarp(session)
-                    download_fb_interview_sheet(session, fb_interview_sheet_file, user_key, year_month)
-
-            with open(fb_interview_sheet_file, 'r', encoding='utf-8') as f:
-                fb_interview_sheet_data = json.load(f).get("data")
-
-            evaluation_abc_file = BASE_DIR / "data" / ("評価ABC_" + str(user_key) + "_" + year_month + ".json")
-            if not os.path.isfile(evaluation_abc_file):
-                with requests.Session() as session:
-                    login_newarp(session)
-                    download_evaluation_abc(session, evaluation_abc_file, user_key, year_month)
-
-            with open(evaluation_abc_file, 'r', encoding='utf-8') as f:
-                evaluation_abc_data = json.load(f)
-
-            result_data = {}
-            result_data["評価年月"] = fb_interview_sheet_data.get("info").get("periodName")
-
-            fb_interview = {}
-            fb_interview["将来のあるべき姿"] = fb_interview_sheet_data.get("info").get("vision")
-            fb_interview["アピールポイント"] = fb_interview_sheet_data.get("info").get("appeal")
-            fb_interview["会社へ一言"] = fb_interview_sheet_data.get("info").get("note")
-            fb_interview["技術分類"] = fb_interview_sheet_data.get("info").get("evaluationKind")
-            fb_interview["評価ステージ"] = fb_interview_sheet_data.get("info").get("evaluationStage")
-            fb_interview["評価クラス"] = fb_interview_sheet_data.get("info").get("evaluationClass")
-            fb_interview["管理職からの期待"] = fb_interview_sheet_data.get("info").get("expectation")
-            result_data["評価全体情報"] = fb_interview
-
-            past_goals = []        
-            for past_goal in fb_interview_sheet_data.get("pastDetails"):
-                past_goals.append({
-                    "目標": past_goal.get("goal", ""),
-                    "達成条件": past_goal.get("condition", ""),
-                    "達成度(%)": past_goal.get("assessment", ""),
-                    "実行結果コメント": past_goal.get("comment", ""),
-                    "管理職からのコメント": past_goal.get("assessmentComment", ""),
-                })
-            result_data["前期目標振り返り"] = past_goals
-
-            next_goals = []        
-            for next_goal in fb_interview_sheet_data.get("pastDetails"):
-                next_goals.append({
-                    "目標": next_goal.get("goal", ""),
-                    "達成条件": next_goal.get("condition", ""),
-                })
-            result_data["来季目標"] = next_goals
-
-            skill_evaluations = []
-            for skill_evaluation_self in evaluation_abc_data.get("data"):
-                if skill_evaluation_self["groupName"] == "業績考課" or skill_evaluation_self["groupName"] == "技術考課":
-                    continue
-                if not skill_evaluation_self["itemPoints"]:
-                    continue
-
-                skill_evaluation_not_self = [not_self for not_self in evaluation_abc_data.get("dataNotSelf") if not_self["evaluationKindId"] == skill_evaluation_self["evaluationKindId"]][0]
-                skill_evaluations.append({
-                    "スキル種類": skill_evaluation_self.get("groupName", ""),
-                    "スキル名": skill_evaluation_self.get("evaluationKind", ""),
-                    "自己評価得点": skill_evaluation_self.get("itemPoints", ""),
-                    "管理職評価得点": skill_evaluation_not_self.get("itemPoints", "")
-                })
-            result_data["能力評価得点"] = skill_evaluations
-
-            technical_evaluations = []
-            for technical_evaluation_self in evaluation_abc_data.get("data"):
-                if technical_evaluation_self["groupName"] != "技術考課":
-                    continue
-                if not technical_evaluation_self["itemPoints"]:
-                    continue
-
-                technical_evaluation_not_self = [not_self for not_self in evaluation_abc_data.get("dataNotSelf") if not_self["evaluationKindId"] == technical_evaluation_self["evaluationKindId"]][0]
-                technical_evaluations.append({
-                    "スキル種類": technical_evaluation_self.get("groupName", ""),
-                    "スキル名": technical_evaluation_self.get("evaluationKind", ""),
-                    "自己評価得点": technical_evaluation_self.get("itemPoints", ""),
-                    "管理職評価得点": technical_evaluation_not_self.get("itemPoints", "")
-                })
-            result_data["技術評価得点"] = technical_evaluations
-
-            all_result_data.append(result_data)
+        await ensure_evaluation_files([user_key], inverview_year_months)
+
+        # 組み立て済みの評価面談情報を再利用する（元のファイルが更新された評価年月のみ作り直す）
+        all_result_data = [EVALUATION_SUMMARY_CACHE.get(user_key, year_month) for year_month in inverview_year_months]
 
         return {
             "report_title": "評価面談情報",
@@ -497,5 +895,219 @@ def get_user_evaluation(userName: str) -> dict:
         print(f"評価面談情報取得エラー：{e}", file=sys.stderr)
         return {"error": str(e)}
 
+def get_scope_users(divisionShortName: str, departmentShortName: str, groupShortName: str) -> list:
+    if groupShortName:
+        return MASTER_BACKEND.get_users("グループ短縮名", groupShortName)
+    if departmentShortName:
+        return MASTER_BACKEND.get_users_in_organization("部門短縮名", departmentShortName)
+    if divisionShortName:
+        return MASTER_BACKEND.get_users_in_organization("事業部短縮名", divisionShortName)
+    return MASTER_BACKEND.get_users()
+
+async def get_evaluation_analytics_data(divisionShortName: str, departmentShortName: str, groupShortName: str, yearMonth: str) -> dict:
+    """
+    対象組織の社員の評価面談情報（1評価年月分）を取得し、列ごとの配列と社員ごとの指標を求める
+    """
+    result = await get_user_organization_data()
+    if "error" in result:
+        return result
+
+    year_months = NEWARP_USER_INFO["FB_INTERVIEW_YEAR_MONTH"]
+    year_month = yearMonth or max(year_months)
+    if year_month not in year_months:
+        return {"error": f"評価年月は次のいずれかを指定してください: {', '.join(year_months)}"}
+
+    users = get_scope_users(divisionShortName, departmentShortName, groupShortName)
+    if len(users) > ANALYTICS_MAX_USERS:
+        return {"error": f"対象の社員が多すぎます（{len(users)}名、上限{ANALYTICS_MAX_USERS}名）。事業部・部門・グループを指定して絞り込んでください"}
+
+    user_keys = [user["ユーザキー"] for user in users]
+    # キャッシュがない社員が多い場合も待ち続けないよう、取得済みの社員のみで集計する
+    pending_user_keys = await ensure_evaluation_files_within(user_keys, year_month, ANALYTICS_DOWNLOAD_WAIT)
+
+    # 対象社員のファイルのみ確認し、更新されたものを取り込んで列ごとの配列として取り出す
+    await asyncio.to_thread(EVALUATION_STORE.update, [(user_key, year_month) for user_key in user_keys])
+    columns, has_record = EVALUATION_STORE.get_columns(user_keys, year_month)
+    return {
+        "year_month": year_month,
+        "users": users,
+        "has_record": has_record,
+        "pending_users": len(pending_user_keys),
+        "columns": columns,
+        "metrics": compute_user_metrics(columns, len(users)),
+    }
+
+def get_coverage_description(analytics: dict) -> str:
+    """
+    集計に含まれる社員数（評価のある社員数・取得中の社員数）の説明を返す
+    """
+    description = f"対象社員 {len(analytics['users'])} 名のうち評価のある {int(analytics['has_record'].sum())} 名から集計しています。"
+    if analytics["pending_users"]:
+        description += (
+            f"{analytics['pending_users']} 名の評価面談情報は取得中のため集計に含まれていません"
+            "（しばらくしてから再度呼び出すと反映されます）。"
+        )
+    return description
+
+def get_scope_description(divisionShortName: str, departmentShortName: str, groupShortName: str) -> str:
+    if groupShortName:
+        return f"グループ {groupShortName}"
+    if departmentShortName:
+        return f"部門 {departmentShortName}"
+    if divisionShortName:
+        return f"事業部 {divisionShortName}"
+    return "全社"
+
+@mcp.tool(
+    name="get_evaluation_ranking",
+    description=(
+        "事業部・部門・グループ（省略時は全社）の社員を評価の指標で並べたランキングを返すツールです。"
+        "指標（metric）は 能力評価（自己）・能力評価（管理職）・技術評価（自己）・技術評価（管理職）・目標達成度(%)・自己評価と管理職評価の差 から選びます。"
+        "得点は評価項目の平均、目標達成度は目標の平均です。"
+        "誰の評価が高いか・低いかを知りたい質問では、get_user_evaluation を社員ごとに繰り返し呼ばずにこのツールを使用してください。"
+        "例: 'BSSで技術評価が一番高いのは誰？', '自己評価が管理職評価より高すぎる社員は？'"
+    )
+)
+async def get_evaluation_ranking(
+    metric: str = "技術評価（管理職）",
+    divisionShortName: str = "",
+    departmentShortName: str = "",
+    groupShortName: str = "",
+    yearMonth: str = "",
+    top: int = 10,
+    ascending: bool = False,
+) -> dict:
+    """
+    Args:
+        metric: 並べ替える指標
+        divisionShortName: 対象の事業部短縮名（完全一致）
+        departmentShortName: 対象の部門短縮名（完全一致）
+        groupShortName: 対象のグループ短縮名（完全一致）
+        yearMonth: 評価年月（yyyymm、省略時は最新）
+        top: 返す件数
+        ascending: trueの場合は値の小さい順に並べる
+    """
+    try:
+        if metric not in METRIC_NAMES:
+            return {"error": f"指標は次のいずれかを指定してください: {', '.join(METRIC_NAMES)}"}
+        if top < 1:
+            return {"error": "返す件数（top）には1以上の値を指定してください"}
+
+        analytics = await get_evaluation_analytics_data(divisionShortName, departmentShortName, groupShortName, yearMonth)
+        if "error" in analytics:
+            return analytics
+
+        users = analytics["users"]
+        metrics = analytics["metrics"]
+        result_data = []
+        for rank, user_index in enumerate(rank_users(metrics[metric], top, ascending), start=1):
+            user = users[user_index]
+            result_data.append([
+                rank, user["ユーザ名"], user["グループ短縮名"], user["役職"],
+                *[format_number(metrics[name][user_index]) for name in METRIC_NAMES],
+            ])
+
+        scope = get_scope_description(divisionShortName, departmentShortName, groupShortName)
+        return {
+            "report_title": "評価ランキング",
+            "description": (
+                f"これは{scope}の社員を評価年月 {analytics['year_month']} の「{metric}」で"
+                f"{'小さい' if ascending else '大きい'}順に並べたランキングです。"
+                f"{get_coverage_description(analytics)}"
+                "各行は columns の順の値の配列です。"
+            ),
+            "analysis_instruction": (
+                "質問で求められている順位や社員を文章で回答してください。"
+                "集計に含まれていない社員がいる場合はその旨も伝えてください。"
+            ),
+            "columns": ["順位", "ユーザ名", "グループ短縮名", "役職", *METRIC_NAMES],
+            "data": result_data,
+        }
+    except Exception as e:
+        print(f"評価ランキング取得エラー：{e}", file=sys.stderr)
+        return {"error": str(e)}
+
+@mcp.tool(
+    name="get_evaluation_statistics",
+    description=(
+        "事業部・部門・グループ（省略時は全社）の評価を集計して返すツールです。"
+        "部門またはグループ（groupBy）ごとに、評価の平均（能力評価・技術評価の自己/管理職、目標達成度、自己評価と管理職評価の差）と、"
+        "管理職評価得点の分布を返します。"
+        "部門ごとの平均や評価の傾向を知りたい質問では、get_user_evaluation を社員ごとに繰り返し呼ばずにこのツールを使用してください。"
+        "例: '部門ごとの目標達成度の平均は？', 'BSS事業部の技術評価の分布を教えて'"
+    )
+)
+async def get_evaluation_statistics(
+    divisionShortName: str = "",
+    departmentShortName: str = "",
+    groupShortName: str = "",
+    yearMonth: str = "",
+    groupBy: str = "部門",
+    limit: int = 0,
+    offset: int = 0,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    continuationToken: str = "",
+) -> dict:
+    """
+    Args:
+        divisionShortName: 対象の事業部短縮名（完全一致）
+        departmentShortName: 対象の部門短縮名（完全一致）
+        groupShortName: 対象のグループ短縮名（完全一致）
+        yearMonth: 評価年月（yyyymm、省略時は最新）
+        groupBy: 集計単位（部門 または グループ）
+        limit: 返す最大件数（省略時は上限なし。結果が大きい場合は文字数の上限で打ち切られる）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列名のリスト（省略時はすべての列）
+        compact: trueの場合、各行を列名付きの辞書ではなくcolumnsの順の値の配列で返す
+        continuationToken: 前回の結果の page.continuationToken（結果の続きを取得する場合に指定）
+    """
+    try:
+        if groupBy not in ("部門", "グループ"):
+            return {"error": "集計単位は 部門 または グループ を指定してください"}
+
+        analytics = await get_evaluation_analytics_data(divisionShortName, departmentShortName, groupShortName, yearMonth)
+        if "error" in analytics:
+            return analytics
+
+        # 社員の所属グループから集計単位（部門・グループ）を求める
+        organization_by_group = {row["グループ短縮名"]: row for row in MASTER_BACKEND.get_organizations()}
+        unit_columns = ["事業部短縮名", "部門短縮名"] if groupBy == "部門" else ["事業部短縮名", "部門短縮名", "グループ短縮名"]
+        unit_keys = {}
+        user_unit_indexes = []
+        for user in analytics["users"]:
+            organization = organization_by_group.get(user["グループ短縮名"], {"グループ短縮名": user["グループ短縮名"]})
+            unit_key = tuple(organization.get(column, "") for column in unit_columns)
+            user_unit_indexes.append(unit_keys.setdefault(unit_key, len(unit_keys)))
+        user_unit_indexes = np.array(user_unit_indexes, dtype=np.int64)
+
+        user_counts = np.bincount(user_unit_indexes, minlength=len(unit_keys))
+        unit_summaries = summarize_by_unit(user_unit_indexes, len(unit_keys), analytics["metrics"], analytics["has_record"])
+        result_data = [
+            {**dict(zip(unit_columns, unit_key)), "社員数": int(user_counts[unit_index]), **unit_summaries[unit_index]}
+            for unit_key, unit_index in sorted(unit_keys.items())
+        ]
+
+        scope = get_scope_description(divisionShortName, departmentShortName, groupShortName)
+        return paginate_result({
+            "report_title": "評価集計",
+            "description": (
+                f"これは{scope}の評価年月 {analytics['year_month']} の評価を{groupBy}ごとに集計した結果です。"
+                f"{get_coverage_description(analytics)}"
+                "得点は評価項目の平均、目標達成度は目標の平均、差は（自己評価 − 管理職評価）の平均です。"
+                "distribution は管理職評価得点ごとの評価項目の件数です。"
+            ),
+            "analysis_instruction": (
+                "質問で求められている平均・傾向・比較を文章で回答してください。"
+                "集計に含まれていない社員がいる場合はその旨も伝えてください。"
+            ),
+            "columns": [*unit_columns, "社員数", "評価対象者数", *METRIC_NAMES],
+            "data": result_data,
+            "distribution": compute_score_distribution(analytics["columns"]),
+        }, limit, offset, columns, compact, continuationToken)
+    except Exception as e:
+        print(f"評価集計取得エラー：{e}", file=sys.stderr)
+        return {"error": str(e)}
+
 if __name__ == "__main__":
     mcp.run(transport="http", host="0.0.0.0", port=os.getenv("MCP_HTTP_PORT", "8081"))
\ No newline at end of file
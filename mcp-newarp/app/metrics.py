@@ -0,0 +1,42 @@
+import time
+from fastmcp.server.middleware import Middleware
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+
+# ツールの処理時間（秒）
+TOOL_LATENCY = Histogram(
+    "newarp_mcp_tool_duration_seconds", "MCPツールの処理時間（秒）", ["tool"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+TOOL_ERRORS = Counter("newarp_mcp_tool_errors_total", "MCPツールの例外発生回数", ["tool"])
+
+# data配下のキャッシュの利用状況（state: fresh / stale / expired / missing）
+CACHE_LOOKUPS = Counter("newarp_cache_lookups_total", "キャッシュファイルの有効期限判定の回数", ["state"])
+MEMORY_CACHE_LOOKUPS = Counter("newarp_memory_cache_lookups_total", "メモリ上のキャッシュの参照回数", ["result"])
+
+# NeWarpからの取得（endpoint: url.jsonのキー）
+NEWARP_DOWNLOADS = Counter("newarp_downloads_total", "NeWarpからの取得回数", ["endpoint", "result"])
+NEWARP_DOWNLOAD_SECONDS = Histogram(
+    "newarp_download_duration_seconds", "NeWarpからの取得時間（秒）", ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+NEWARP_LOGINS = Counter("newarp_logins_total", "NeWarpへのログイン回数")
+
+class ToolMetricsMiddleware(Middleware):
+    """
+    ツールごとの処理時間と例外の回数を記録する
+    """
+    async def on_call_tool(self, context, call_next):
+        tool_name = context.message.name
+        start_time = time.perf_counter()
+        try:
+            return await call_next(context)
+        except Exception:
+            TOOL_ERRORS.labels(tool_name).inc()
+            raise
+        finally:
+            TOOL_LATENCY.labels(tool_name).observe(time.perf_counter() - start_time)
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
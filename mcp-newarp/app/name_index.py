@@ -0,0 +1,76 @@
+import os
+import unicodedata
+
+# 1: 全角/半角・カタカナ/ひらがなの違いを無視して検索する
+NAME_NORMALIZE = os.getenv("NEWARP_NAME_NORMALIZE", "0") == "1"
+
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+def normalize_name(text: str) -> str:
+    """
+    検索用に文字列を正規化する（全角/半角を統一し、カタカナをひらがなに寄せる）
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = text.translate(KATAKANA_TO_HIRAGANA)
+    return text.replace(" ", "").replace("　", "")
+
+def get_ngrams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class NameIndex:
+    """
+    文字バイグラムの転置索引による部分一致検索
+    候補は転置リストの積集合で絞り込み、最後に部分一致で確認するため結果は線形走査と同じになる
+    """
+    def __init__(self, rows: list, key: str, normalize: bool = NAME_NORMALIZE):
+        self._rows = []
+        self._key = key
+        self._normalize = normalize
+        self._names = []
+        self._unigrams = {}
+        self._bigrams = {}
+
+        for row in rows:
+            self.add(row)
+
+    def add(self, row: dict):
+        """
+        行を末尾に追加して索引に登録する
+        """
+        row_no = len(self._rows)
+        name = self._to_search_text(row.get(self._key) or "")
+        self._rows.append(row)
+        self._names.append(name)
+        for unigram in set(name):
+            self._unigrams.setdefault(unigram, []).append(row_no)
+        for bigram in get_ngrams(name, 2):
+            self._bigrams.setdefault(bigram, []).append(row_no)
+
+    def _to_search_text(self, text: str) -> str:
+        return normalize_name(text) if self._normalize else text
+
+    def _candidates(self, query: str):
+        if len(query) == 1:
+            return self._unigrams.get(query, [])
+
+        postings = []
+        for bigram in get_ngrams(query, 2):
+            posting = self._bigrams.get(bigram)
+            if not posting:
+                return []
+            postings.append(posting)
+
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return sorted(candidates)
+
+    def search(self, query: str) -> list:
+        query = self._to_search_text(query)
+        if not query:
+            return list(self._rows)
+
+        return [self._rows[row_no] for row_no in self._candidates(query) if query in self._names[row_no]]
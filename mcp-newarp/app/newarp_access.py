@@ -1,58 +1,215 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
 import json
-import requests
+import os
+import time
+import httpx
+from cache_format import CacheStreamWriter, save_cache_file
+from json_stream import DataArrayParser, ijson
+from metrics import NEWARP_DOWNLOADS, NEWARP_DOWNLOAD_SECONDS, NEWARP_LOGINS
 
 BASE_DIR = Path(__file__).resolve().parent
 USER_AGENT="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
+# NeWarpへの同時接続数とタイムアウト（秒）
+NEWARP_MAX_CONNECTIONS = int(os.getenv("NEWARP_MAX_CONNECTIONS", "10"))
+NEWARP_TIMEOUT = float(os.getenv("NEWARP_TIMEOUT", "60"))
+
 with open(BASE_DIR / 'config' / 'url.json', 'r', encoding='utf-8') as f:
     NEWARP_URLS = json.load(f)
 
 with open(BASE_DIR / 'config' / 'logininfo.json', 'r', encoding='utf-8') as f:
     NEWARP_USER_INFO = json.load(f)
 
-def login_newarp(session: requests.Session):
-    payload = {
-        "engageCode": NEWARP_USER_INFO["ENGAGE_CODE"],
-        "userId": NEWARP_USER_INFO["USER_ID"],
-        "pass": NEWARP_USER_INFO["PASSWORD"]
-    }
+# 計測用にURLから url.json のキーを引く
+NEWARP_URL_NAMES = {url: name for name, url in NEWARP_URLS.items() if not name.endswith("_REFERER")}
 
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": USER_AGENT
-    }
+def get_content_type(response: httpx.Response) -> str:
+    return response.headers.get("content-type", "").split(";", 1)[0].strip().lower()
 
-    response = session.post(NEWARP_URLS["LOGIN"], json=payload, headers=headers)
-    response.raise_for_status() # 200番台以外は例外を投げる
+def is_session_expired(response: httpx.Response) -> bool:
+    # 認証エラー、ログイン画面へのリダイレクト、またはログイン画面（HTML）が返ってきた場合はセッション切れとみなす
+    if response.status_code in (401, 403):
+        return True
+    if response.is_redirect:
+        return "login" in response.headers.get("location", "").lower()
+    return response.is_success and get_content_type(response) == "text/html"
 
-def download_json(session: requests.Session, url: str, referer: str, payload, save_filepath: str):
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": USER_AGENT,
-        "Referer": referer
-    }
+def check_json_response(response: httpx.Response):
+    """
+    JSON以外の応答は再ログインせずにエラーとする
+    """
+    content_type = get_content_type(response)
+    if "json" not in content_type:
+        raise ValueError(f"NeWarpからJSON以外の応答が返されました: {response.url}（Content-Type: {content_type or 'なし'}）")
+
+class NewarpClient:
+    """
+    NeWarpへの非同期クライアント
+    コネクションプールとログイン済みセッションを全ツールで共有し、セッション切れ時は自動で再ログインする
+    """
+    def __init__(self):
+        self._client = None
+        self._login_lock = asyncio.Lock()
+        self._login_count = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=NEWARP_MAX_CONNECTIONS,
+                    max_keepalive_connections=NEWARP_MAX_CONNECTIONS,
+                ),
+                timeout=NEWARP_TIMEOUT,
+            )
+        return self._client
+
+    async def login(self, expired_login_count: int = None):
+        """
+        Args:
+            expired_login_count: セッション切れを検知した時点のログイン回数（他の処理が再ログイン済みなら何もしない）
+        """
+        async with self._login_lock:
+            if expired_login_count is None and self._login_count > 0:
+                return
+            if expired_login_count is not None and expired_login_count != self._login_count:
+                return
+
+            payload = {
+                "engageCode": NEWARP_USER_INFO["ENGAGE_CODE"],
+                "userId": NEWARP_USER_INFO["USER_ID"],
+                "pass": NEWARP_USER_INFO["PASSWORD"]
+            }
+
+            headers = {
+                "Content-Type": "application/json",
+            }
+
+            client = self._get_client()
+            client.cookies.clear()
+            response = await client.post(NEWARP_URLS["LOGIN"], json=payload, headers=headers)
+            response.raise_for_status() # 200番台以外は例外を投げる
+            self._login_count += 1
+            NEWARP_LOGINS.inc()
+
+    async def post_json(self, url: str, referer: str, payload) -> dict:
+        await self.login()
+
+        headers = {
+            "Content-Type": "application/json",
+            "Referer": referer
+        }
+
+        login_count = self._login_count
+        response = await self._get_client().post(url, json=payload, headers=headers)
+        if is_session_expired(response):
+            await self.login(login_count)
+            response = await self._get_client().post(url, json=payload, headers=headers)
+
+        response.raise_for_status()
+        check_json_response(response)
+        return response.json()
+
+    @asynccontextmanager
+    async def stream_post(self, url: str, referer: str, payload):
+        """
+        応答の本文を読み込まずに返す（本文は response.aiter_bytes() で受信しながら処理する）
+        """
+        await self.login()
+
+        headers = {
+            "Content-Type": "application/json",
+            "Referer": referer
+        }
+
+        client = self._get_client()
+        login_count = self._login_count
+        response = await client.send(client.build_request("POST", url, json=payload, headers=headers), stream=True)
+        try:
+            if is_session_expired(response):
+                await response.aclose()
+                await self.login(login_count)
+                response = await client.send(client.build_request("POST", url, json=payload, headers=headers), stream=True)
+
+            response.raise_for_status()
+            check_json_response(response)
+            yield response
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._login_count = 0
+
+# 全ツールで共有するクライアント
+NEWARP_CLIENT = NewarpClient()
+
+@asynccontextmanager
+async def record_download(url: str):
+    endpoint = NEWARP_URL_NAMES.get(url, "OTHER")
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        NEWARP_DOWNLOADS.labels(endpoint, "error").inc()
+        raise
+    finally:
+        NEWARP_DOWNLOAD_SECONDS.labels(endpoint).observe(time.perf_counter() - start_time)
+    NEWARP_DOWNLOADS.labels(endpoint, "success").inc()
+
+async def download_json(client: NewarpClient, url: str, referer: str, payload, save_filepath: str) -> dict:
+    async with record_download(url):
+        response_json = await client.post_json(url, referer, payload)
+        save_cache_file(response_json, save_filepath)
+    return response_json
+
+async def download_master_json(client: NewarpClient, url: str, referer: str, payload, save_filepath: str, row_handler=None):
+    """
+    マスタを取得して保存する
+    ijsonがある場合は応答全体をメモリに読み込まず、受信しながらdata配列を1件ずつ解析してファイルに追記する
+
+    Args:
+        row_handler: data配列の要素を1件ずつ受け取る関数（受信しながら索引を作成する場合に指定）
+    """
+    if ijson is None:
+        response_json = await download_json(client, url, referer, payload, save_filepath)
+        if row_handler is not None:
+            for row in response_json.get("data") or []:
+                row_handler(row)
+        return
+
+    async with record_download(url), client.stream_post(url, referer, payload) as response:
+        with CacheStreamWriter(save_filepath) as writer:
+            parser = DataArrayParser()
 
-    response = session.post(url, json=payload, headers=headers)
-    response.raise_for_status()
+            def write_rows(rows: list):
+                for row in rows:
+                    writer.write_row(row)
+                    if row_handler is not None:
+                        row_handler(row)
 
-    response_json = response.json()
-    with open(save_filepath, 'w', encoding='utf-8') as f:
-        json.dump(response_json, f, ensure_ascii=False, indent=2)
+            async for chunk in response.aiter_bytes():
+                write_rows(parser.feed(chunk))
+            write_rows(parser.close())
+            writer.commit(parser.extra)
 
 
 # 事業部マスタ
-def dewonload_division_master(session: requests.Session, save_filepath: str):
+async def dewonload_division_master(client: NewarpClient, save_filepath: str, row_handler=None):
     url = NEWARP_URLS["GET_DIVISION_MASTER"]
     referer = NEWARP_URLS["GET_DIVISION_MASTER_REFERER"]
     payload = {
         "divisionName": "",
         "divisionShortName": ""
     }
-    download_json(session, url, referer, payload, save_filepath)
+    await download_master_json(client, url, referer, payload, save_filepath, row_handler)
 
 # 部門マスタ
-def dewonload_department_master(session: requests.Session, save_filepath: str):
+async def dewonload_department_master(client: NewarpClient, save_filepath: str, row_handler=None):
     url = NEWARP_URLS["GET_DEPARTMENT_MASTER"]
     referer = NEWARP_URLS["GET_DEPARTMENT_MASTER_REFERER"]
     payload = {
@@ -60,10 +217,10 @@ def dewonload_department_master(session: requests.Session, save_filepath: str):
         "departmentName": "",
         "departmentShortName": ""
     }
-    download_json(session, url, referer, payload, save_filepath)
+    await download_master_json(client, url, referer, payload, save_filepath, row_handler)
 
 # 課マスタ
-def dewonload_group_master(session: requests.Session, save_filepath: str):
+async def dewonload_group_master(client: NewarpClient, save_filepath: str, row_handler=None):
     url = NEWARP_URLS["GET_GROUP_MASTER"]
     referer = NEWARP_URLS["GET_GROUP_MASTER_REFERER"]
     payload = {
@@ -72,10 +229,10 @@ def dewonload_group_master(session: requests.Session, save_filepath: str):
         "groupName": "",
         "groupShortName": ""
     }
-    download_json(session, url, referer, payload, save_filepath)
+    await download_master_json(client, url, referer, payload, save_filepath, row_handler)
 
 # ユーザマスタ
-def download_user_master(session: requests.Session, save_filepath: str):
+async def download_user_master(client: NewarpClient, save_filepath: str, row_handler=None):
     url = NEWARP_URLS["GET_USER_MASTER"]
     referer = NEWARP_URLS["GET_USER_MASTER_REFERER"]
     payload = {
@@ -89,24 +246,24 @@ def download_user_master(session: requests.Session, save_filepath: str):
         "positionId": "",
         "authorityId": ""
     }
-    download_json(session, url, referer, payload, save_filepath)
+    await download_master_json(client, url, referer, payload, save_filepath, row_handler)
 
 # FB面談シート
-def download_fb_interview_sheet(session: requests.Session, save_filepath: str, user_key: str, year_month: str):
+async def download_fb_interview_sheet(client: NewarpClient, save_filepath: str, user_key: str, year_month: str):
     url = NEWARP_URLS["GET_FB_INTERVIEW_SHEET"]
     referer = NEWARP_URLS["GET_FB_INTERVIEW_SHEET_REFERER"]
     payload = {
         "userKey": user_key,
         "goalManagementPeriodId": year_month
     }
-    download_json(session, url, referer, payload, save_filepath)
+    await download_json(client, url, referer, payload, save_filepath)
 
 # 評価ABC
-def download_evaluation_abc(session: requests.Session, save_filepath: str, user_key: str, year_month: str):
+async def download_evaluation_abc(client: NewarpClient, save_filepath: str, user_key: str, year_month: str):
     url = NEWARP_URLS["GET_EVALUATION"]
     referer = NEWARP_URLS["GET_EVALUATION_REFERER"]
     payload = {
         "userKey": user_key,
         "goalManagementPeriodId": year_month
     }
-    download_json(session, url, referer, payload, save_filepath)
\ No newline at end of file
+    await download_json(client, url, referer, payload, save_filepath)
\ No newline at end of file
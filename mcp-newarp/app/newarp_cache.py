@@ -0,0 +1,118 @@
+from collections import OrderedDict
+import asyncio
+import os
+import sys
+import threading
+import time
+from cache_format import load_cache_file
+from metrics import CACHE_LOOKUPS, MEMORY_CACHE_LOOKUPS
+
+# データ種別ごとの有効期限（秒）
+MASTER_CACHE_TTL = int(os.getenv("NEWARP_MASTER_CACHE_TTL", "86400"))
+EVALUATION_CACHE_TTL = int(os.getenv("NEWARP_EVALUATION_CACHE_TTL", "604800"))
+
+# 有効期限切れ後、古いデータを返しつつ裏で再取得する猶予期間（秒）
+CACHE_STALE_TTL = int(os.getenv("NEWARP_CACHE_STALE_TTL", "2592000"))
+
+# メモリ上に保持するファイル数
+MEMORY_CACHE_SIZE = int(os.getenv("NEWARP_MEMORY_CACHE_SIZE", "512"))
+
+CACHE_FRESH = "fresh"
+CACHE_STALE = "stale"
+CACHE_EXPIRED = "expired"
+CACHE_MISSING = "missing"
+
+def get_cache_state(filepath, ttl: int) -> str:
+    """
+    ファイルの更新日時（＝取得日時）から有効期限の状態を判定する
+    """
+    try:
+        age = time.time() - os.path.getmtime(filepath)
+    except FileNotFoundError:
+        return CACHE_MISSING
+
+    if age <= ttl:
+        return CACHE_FRESH
+    if age <= ttl + CACHE_STALE_TTL:
+        return CACHE_STALE
+    return CACHE_EXPIRED
+
+class NewarpCache:
+    """
+    data配下のキャッシュファイルを管理する
+    - 有効期限内はそのまま、猶予期間内は古いデータを返しつつ裏で再取得、それ以降は取得を待つ
+    - 同じファイルへの同時取得は1回にまとめる
+    - 読み込んだデータはLRUでメモリに保持する
+    """
+    def __init__(self, memory_size: int = MEMORY_CACHE_SIZE):
+        self._memory_size = memory_size
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._inflight = {}
+
+    def _download(self, filepath, download) -> asyncio.Future:
+        key = str(filepath)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(download())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    def _refresh_in_background(self, filepath, download):
+        def log_error(task: asyncio.Future):
+            if not task.cancelled() and task.exception() is not None:
+                print(f"キャッシュ再取得エラー: {filepath}: {task.exception()}", file=sys.stderr)
+
+        self._download(filepath, download).add_done_callback(log_error)
+
+    async def ensure(self, filepath, ttl: int, download):
+        """
+        Args:
+            filepath: キャッシュファイルのパス
+            ttl: 有効期限（秒）
+            download: ファイルを取得する引数なしのコルーチン関数
+        """
+        state = get_cache_state(filepath, ttl)
+        CACHE_LOOKUPS.labels(state).inc()
+        if state == CACHE_FRESH:
+            return
+        if state == CACHE_STALE:
+            self._refresh_in_background(filepath, download)
+            return
+
+        try:
+            await asyncio.shield(self._download(filepath, download))
+        except Exception as e:
+            if state == CACHE_MISSING:
+                raise
+            # 取得に失敗しても古いファイルがあればそれを使う
+            print(f"キャッシュ再取得エラー（古いデータを使用）: {filepath}: {e}", file=sys.stderr)
+
+    def discard(self, filepath):
+        with self._memory_lock:
+            self._memory.pop(str(filepath), None)
+
+    def load(self, filepath):
+        stat = os.stat(filepath)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        key = str(filepath)
+
+        with self._memory_lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[0] == signature:
+                self._memory.move_to_end(key)
+                MEMORY_CACHE_LOOKUPS.labels("hit").inc()
+                return cached[1]
+
+        MEMORY_CACHE_LOOKUPS.labels("miss").inc()
+        data = load_cache_file(filepath)
+
+        with self._memory_lock:
+            self._memory[key] = (signature, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_size:
+                self._memory.popitem(last=False)
+        return data
+
+NEWARP_CACHE = NewarpCache()
@@ -0,0 +1,137 @@
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from newarp_access import *
+from master_store import *
+from newarp_cache import *
+
+PROGRESS_FILE = DATA_DIR / "prefetch_progress.json"
+
+class RateLimiter:
+    """
+    NeWarpへのリクエスト間隔を一定以上に保つ（rate: 1秒あたりの最大リクエスト数、0は無制限）
+    """
+    def __init__(self, rate: float):
+        self._interval = 1 / rate if rate > 0 else 0
+        self._lock = asyncio.Lock()
+        self._next_time = 0
+
+    async def wait(self):
+        if not self._interval:
+            return
+
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if self._next_time > now:
+                await asyncio.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time) + self._interval
+
+def load_progress() -> set:
+    if not os.path.isfile(PROGRESS_FILE):
+        return set()
+    with open(PROGRESS_FILE, 'r', encoding='utf-8') as f:
+        return set(json.load(f).get("completed", []))
+
+def save_progress(completed: set):
+    tmp_filepath = str(PROGRESS_FILE) + ".tmp"
+    with open(tmp_filepath, 'w', encoding='utf-8') as f:
+        json.dump({"completed": sorted(completed)}, f, ensure_ascii=False)
+    os.replace(tmp_filepath, PROGRESS_FILE)
+
+async def prefetch_masters(refresh: bool):
+    for download_function, save_filepath in [
+        (dewonload_division_master, DIVISION_MASTER_FILE),
+        (dewonload_department_master, DEPARTMENT_MASTER_FILE),
+        (dewonload_group_master, GROUP_MASTER_FILE),
+        (download_user_master, USER_MASTER_FILE),
+    ]:
+        if refresh or get_cache_state(save_filepath, MASTER_CACHE_TTL) != CACHE_FRESH:
+            await download_function(NEWARP_CLIENT, save_filepath)
+
+async def prefetch_evaluations(concurrency: int, rate: float, refresh: bool, resume: bool) -> dict:
+    user_keys = [user["ユーザキー"] for user in USER_STORE.get()["data"]]
+    year_months = NEWARP_USER_INFO["FB_INTERVIEW_YEAR_MONTH"]
+
+    completed = load_progress() if resume else set()
+    summary = {"total": 0, "downloaded": 0, "skipped": 0, "bytes": 0, "failures": []}
+
+    targets = []
+    for user_key in user_keys:
+        for year_month in year_months:
+            for download_function, save_filepath in [
+                (download_fb_interview_sheet, get_fb_interview_sheet_file(user_key, year_month)),
+                (download_evaluation_abc, get_evaluation_abc_file(user_key, year_month)),
+            ]:
+                summary["total"] += 1
+                if save_filepath.name in completed or (not refresh and get_cache_state(save_filepath, EVALUATION_CACHE_TTL) == CACHE_FRESH):
+                    summary["skipped"] += 1
+                    continue
+                targets.append((download_function, save_filepath, user_key, year_month))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RateLimiter(rate)
+
+    async def download(download_function, save_filepath: Path, user_key: str, year_month: str):
+        async with semaphore:
+            await rate_limiter.wait()
+            try:
+                await download_function(NEWARP_CLIENT, save_filepath, user_key, year_month)
+            except Exception as e:
+                print(f"ダウンロードエラー: {save_filepath.name}: {e}", file=sys.stderr)
+                summary["failures"].append({"file": save_filepath.name, "error": str(e)})
+                return
+
+            summary["downloaded"] += 1
+            summary["bytes"] += os.path.getsize(save_filepath)
+            completed.add(save_filepath.name)
+            if summary["downloaded"] % 100 == 0:
+                save_progress(completed)
+                print(f"進捗: {summary['downloaded']}/{len(targets)}", file=sys.stderr)
+
+    await asyncio.gather(*(download(*target) for target in targets))
+
+    if summary["failures"]:
+        save_progress(completed)
+    elif os.path.isfile(PROGRESS_FILE):
+        os.remove(PROGRESS_FILE)
+
+    return summary
+
+async def main():
+    parser = argparse.ArgumentParser(description="全社員の評価面談情報をdata配下に事前取得する")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("NEWARP_DOWNLOAD_CONCURRENCY", "5")), help="同時ダウンロード数")
+    parser.add_argument("--rate", type=float, default=5, help="1秒あたりの最大リクエスト数（0は無制限）")
+    parser.add_argument("--refresh", action="store_true", help="有効期限内のファイルも再取得する")
+    parser.add_argument("--resume", action="store_true", help="前回中断した実行の続きから再開する")
+    parser.add_argument("--report", help="実行結果をJSONで出力するファイルパス")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    try:
+        await prefetch_masters(args.refresh and not args.resume)
+        summary = await prefetch_evaluations(args.concurrency, args.rate, args.refresh, args.resume)
+    finally:
+        await NEWARP_CLIENT.aclose()
+    summary["elapsed_seconds"] = round(time.perf_counter() - start_time, 1)
+
+    print(f"対象件数: {summary['total']}")
+    print(f"取得件数: {summary['downloaded']}")
+    print(f"スキップ件数: {summary['skipped']}")
+    print(f"取得サイズ: {summary['bytes']} bytes")
+    print(f"処理時間: {summary['elapsed_seconds']} 秒")
+    print(f"失敗件数: {len(summary['failures'])}")
+    for failure in summary["failures"]:
+        print(f"  {failure['file']}: {failure['error']}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    return 1 if summary["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,119 @@
+import base64
+import json
+import os
+
+# ツール結果のdataの上限文字数（JSON換算。超えた分は continuationToken で続きを取得する。0は無制限）
+TOOL_RESULT_MAX_CHARS = int(os.getenv("NEWARP_TOOL_RESULT_MAX_CHARS", "30000"))
+
+CONTINUATION_INSTRUCTION = (
+    "結果の続きがあります。続きが必要な場合は continuationToken に page.continuationToken の値を指定し、"
+    "同じツールを同じ検索条件で再度呼び出してください。"
+)
+
+def encode_continuation_token(state: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+def decode_continuation_token(token: str) -> dict:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        state["offset"] = int(state["offset"])
+        state["limit"] = int(state.get("limit") or 0)
+        return state
+    except Exception:
+        raise ValueError("continuationToken が不正です。前回の結果の page.continuationToken の値をそのまま指定してください")
+
+def iter_rows(data, path: tuple = ()):
+    """
+    行のリスト、または検索条件ごとの行のリスト（入れ子の辞書）から (検索条件のパス, 行) を順に返す
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from iter_rows(value, path + (key,))
+    else:
+        for row in data:
+            yield path, row
+
+def regroup_rows(items: list, grouped: bool):
+    """
+    iter_rows で平坦化した行を元の形（リスト、または入れ子の辞書）に戻す
+    """
+    if not grouped:
+        return [row for _, row in items]
+
+    result = {}
+    for path, row in items:
+        node = result
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node.setdefault(path[-1], []).append(row)
+    return result
+
+def paginate_result(result: dict, limit: int = 0, offset: int = 0, columns: list = None, compact: bool = False,
+                    continuation_token: str = "", max_chars: int = TOOL_RESULT_MAX_CHARS) -> dict:
+    """
+    ツール結果のdataに件数・列の指定と文字数の上限を適用する
+
+    Args:
+        result: columns・data（行のリスト、または検索条件ごとの行のリスト）を含むツール結果
+        limit: 返す最大件数（0は上限なし）
+        offset: 先頭から読み飛ばす件数
+        columns: 返す列（省略時はすべて）
+        compact: Trueの場合、各行を辞書ではなくcolumnsの順の値の配列で返す
+        continuation_token: 前回の結果の続きを取得するためのトークン（指定時は他の引数より優先）
+        max_chars: dataの上限文字数（JSON換算、0は無制限）
+    """
+    if continuation_token:
+        try:
+            state = decode_continuation_token(continuation_token)
+        except ValueError as e:
+            return {"error": str(e)}
+        offset = state["offset"]
+        limit = state["limit"]
+        columns = state.get("columns")
+        compact = state.get("compact", False)
+
+    if limit < 0 or offset < 0:
+        return {"error": "limit・offset には0以上の値を指定してください"}
+
+    all_columns = result["columns"]
+    if columns:
+        unknown_columns = [column for column in columns if column not in all_columns]
+        if unknown_columns:
+            return {"error": f"存在しない列が指定されました: {', '.join(unknown_columns)}（指定できる列: {', '.join(all_columns)}）"}
+    output_columns = list(columns) if columns else all_columns
+
+    data = result["data"]
+    items = list(iter_rows(data))
+    total = len(items)
+    end = min(total, offset + limit) if limit > 0 else total
+
+    page_items = []
+    size = 0
+    for path, row in items[offset:end]:
+        if compact:
+            row = [row.get(column) for column in output_columns]
+        elif columns:
+            row = {column: row.get(column) for column in output_columns}
+
+        size += len(json.dumps(row, ensure_ascii=False))
+        # 1行も返せないことがないよう、先頭の1行は上限を超えていても返す
+        if max_chars > 0 and page_items and size > max_chars:
+            break
+        page_items.append((path, row))
+
+    next_offset = offset + len(page_items)
+    page = {"total": total, "offset": offset, "returned": len(page_items)}
+
+    paged_result = dict(result)
+    paged_result["columns"] = output_columns
+    paged_result["data"] = regroup_rows(page_items, isinstance(data, dict))
+    if next_offset < total:
+        page["continuationToken"] = encode_continuation_token({
+            "offset": next_offset,
+            "limit": limit,
+            "columns": columns or None,
+            "compact": compact,
+        })
+        paged_result["analysis_instruction"] = result.get("analysis_instruction", "") + CONTINUATION_INSTRUCTION
+    paged_result["page"] = page
+    return paged_result
@@ -0,0 +1,86 @@
+import asyncio
+import sys
+import time
+from fastmcp.server.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+WARMUP_PENDING = "pending"
+WARMUP_RUNNING = "running"
+WARMUP_DONE = "done"
+WARMUP_FAILED = "failed"
+
+class Warmup:
+    """
+    起動時の準備（ログイン・マスタの取得・索引の作成など）を裏で順に実行し、進捗を保持する
+    steps が終わるまでツール呼び出しを待たせ、background_steps はツール呼び出しと並行して実行する
+    準備に失敗した場合もツール呼び出しは止めない（各ツールが必要なときに改めて取得する）
+    """
+    def __init__(self, steps: list, background_steps: list = ()):
+        """
+        Args:
+            steps: (名前, 引数なしのコルーチン関数) のリスト
+            background_steps: steps の後に実行する (名前, 引数なしのコルーチン関数) のリスト
+        """
+        self._steps = steps
+        self._background_steps = background_steps
+        self._ready = asyncio.Event()
+        self._task = None
+        self.status = {name: {"state": WARMUP_PENDING} for name, _ in [*steps, *background_steps]}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def is_ready(self) -> bool:
+        return self._task is None or self._ready.is_set()
+
+    async def wait(self):
+        """
+        実行中の準備が終わるまで待つ（準備を開始していない場合はすぐに戻る）
+        """
+        if not self.is_ready():
+            await self._ready.wait()
+
+    async def _run(self):
+        try:
+            await self._run_steps(self._steps)
+        finally:
+            self._ready.set()
+        await self._run_steps(self._background_steps)
+
+    async def _run_steps(self, steps: list):
+        for name, function in steps:
+            step = self.status[name]
+            step["state"] = WARMUP_RUNNING
+            start_time = time.perf_counter()
+            try:
+                await function()
+                step["state"] = WARMUP_DONE
+            except Exception as e:
+                step["state"] = WARMUP_FAILED
+                step["error"] = str(e)
+                print(f"起動時の準備エラー: {name}: {e}", file=sys.stderr)
+            finally:
+                step["seconds"] = round(time.perf_counter() - start_time, 3)
+
+    async def readiness_endpoint(self, request: Request) -> JSONResponse:
+        """
+        準備が終わっていれば200、準備中は503を返す（各手順の状態と所要時間を含む）
+        """
+        ready = self.is_ready()
+        return JSONResponse({"ready": ready, "steps": self.status}, status_code=200 if ready else 503)
+
+class WarmupMiddleware(Middleware):
+    """
+    起動時の準備中に呼ばれたツールは、同じ取得・索引作成を重複して行わないよう準備の完了を待ってから実行する
+    """
+    def __init__(self, warmup: Warmup):
+        self._warmup = warmup
+
+    async def on_call_tool(self, context, call_next):
+        await self._warmup.wait()
+        return await call_next(context)
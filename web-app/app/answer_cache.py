@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import math
+import os
+import sys
+import time
+import unicodedata
+import httpx
+from metrics import ANSWER_CACHE_LOOKUPS
+
+# 1: 同じ質問への回答を再利用する
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', '1') == '1'
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '1000'))
+
+# NeWarpのマスタファイルの配置先（マスタの内容が変わったらキャッシュを破棄する）
+NEWARP_DATA_DIR = os.environ.get('NEWARP_DATA_DIR', '/newarp-data')
+NEWARP_MASTER_NAMES = ["事業部マスタ", "部門マスタ", "課マスタ", "ユーザマスタ"]
+NEWARP_MASTER_EXTS = [".msgpack", ".json"]
+
+# 埋め込みによる類似質問の判定（URL未設定時は正規化した質問の完全一致のみ）
+ANSWER_CACHE_EMBEDDING_URL = os.environ.get('ANSWER_CACHE_EMBEDDING_URL', '')
+ANSWER_CACHE_EMBEDDING_MODEL = os.environ.get('ANSWER_CACHE_EMBEDDING_MODEL', 'nomic-embed-text')
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0.95'))
+
+# キャッシュした回答をSSEで返す際の1チャンクの文字数
+REPLAY_CHUNK_SIZE = 20
+
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = "".join(text.split())
+    return text.rstrip("?？。.!！")
+
+def get_master_signature(data_dir: str = NEWARP_DATA_DIR) -> tuple:
+    """
+    マスタファイルの更新日時とサイズを取得する（data配下の他のファイルは走査しない）
+    """
+    signature = []
+    for name in NEWARP_MASTER_NAMES:
+        for ext in NEWARP_MASTER_EXTS:
+            try:
+                stat = os.stat(os.path.join(data_dir, name + ext))
+            except FileNotFoundError:
+                continue
+            signature.append((name + ext, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def get_data_fingerprint(signature: tuple, data_dir: str = NEWARP_DATA_DIR) -> str:
+    """
+    マスタファイルの内容からデータのバージョンを表す値を作成する
+    （内容が同じまま更新日時のみ変わった場合に、キャッシュを破棄しないため）
+    """
+    digest = hashlib.sha1()
+    for filename, _, _ in signature:
+        digest.update(filename.encode("utf-8"))
+        try:
+            with open(os.path.join(data_dir, filename), 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            continue
+    return digest.hexdigest()
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def split_answer(answer: str, chunk_size: int = REPLAY_CHUNK_SIZE) -> List[str]:
+    return [answer[i:i + chunk_size] for i in range(0, len(answer), chunk_size)]
+
+class AnswerCache:
+    """
+    正規化した質問とマスタのバージョンをキーに回答を保持する
+    埋め込みURLが設定されている場合は、類似度が閾値以上の質問にも同じ回答を返す
+    """
+    def __init__(self, ttl: int = ANSWER_CACHE_TTL, max_size: int = ANSWER_CACHE_SIZE):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._signature = None
+        self._fingerprint = None
+
+    def _evict(self):
+        expire_time = time.time() - self._ttl
+        for key in [key for key, entry in self._entries.items() if entry["created"] < expire_time]:
+            del self._entries[key]
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def _embed(self, http_client: httpx.AsyncClient, text: str) -> Optional[List[float]]:
+        if not ANSWER_CACHE_EMBEDDING_URL:
+            return None
+        try:
+            resp = await http_client.post(ANSWER_CACHE_EMBEDDING_URL, json={"model": ANSWER_CACHE_EMBEDDING_MODEL, "input": text})
+            resp.raise_for_status()
+            return resp.json()["embeddings"][0]
+        except Exception as e:
+            print(f"web-error: 埋め込みの取得に失敗しました: {e}", file=sys.stderr)
+            return None
+
+    async def lookup(self, http_client: httpx.AsyncClient, question: str) -> Optional[Dict]:
+        """
+        current_fingerprint でマスタのバージョンを確認してから呼び出す
+
+        Returns:
+            キャッシュした回答（answer）。見つからない場合は None
+        """
+        if not ANSWER_CACHE_ENABLED:
+            return None
+
+        self._evict()
+
+        normalized = normalize_question(question)
+        entry = self._entries.get(normalized)
+        if entry is not None:
+            self._entries.move_to_end(normalized)
+            ANSWER_CACHE_LOOKUPS.labels("hit").inc()
+            return entry
+
+        embedding = await self._embed(http_client, normalized)
+        if embedding is None:
+            ANSWER_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        best_key, best_similarity = None, ANSWER_CACHE_SIMILARITY
+        for key, candidate in self._entries.items():
+            if candidate["embedding"] is None:
+                continue
+            similarity = cosine_similarity(embedding, candidate["embedding"])
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+
+        if best_key is None:
+            ANSWER_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        self._entries.move_to_end(best_key)
+        ANSWER_CACHE_LOOKUPS.labels("hit").inc()
+        return self._entries[best_key]
+
+    async def store(self, http_client: httpx.AsyncClient, question: str, answer: str, fingerprint: str):
+        """
+        Args:
+            fingerprint: 回答を生成し始めた時点のマスタのバージョン（生成中にマスタが更新された回答は保持しない）
+        """
+        if not ANSWER_CACHE_ENABLED or fingerprint != self._fingerprint:
+            return
+
+        normalized = normalize_question(question)
+        self._entries[normalized] = {
+            "answer": answer,
+            "embedding": await self._embed(http_client, normalized),
+            "created": time.time(),
+        }
+        self._entries.move_to_end(normalized)
+        self._evict()
+
+    def current_fingerprint(self) -> str:
+        """
+        マスタのバージョンを返す（1リクエストにつき1回呼び出す）
+        マスタファイルの更新日時・サイズが変わった場合のみ内容のハッシュ値を計算し、内容が変わっていれば以前の回答をすべて破棄する
+        """
+        if not ANSWER_CACHE_ENABLED:
+            return ""
+
+        signature = get_master_signature()
+        if signature != self._signature:
+            fingerprint = get_data_fingerprint(signature)
+            if fingerprint != self._fingerprint:
+                self._entries.clear()
+                self._fingerprint = fingerprint
+            self._signature = signature
+        return self._fingerprint
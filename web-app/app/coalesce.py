@@ -0,0 +1,120 @@
+from typing import AsyncIterator, Callable, Dict, Optional
+import asyncio
+import hashlib
+import json
+import os
+
+# 1: 生成中のものと同じリクエストは新たに生成せず、同じ結果を配信する
+COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', '1') == '1'
+
+def get_payload_key(payload: Dict) -> str:
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+class StreamFlight:
+    """
+    1つの上流ストリームの受信済みチャンクを保持し、途中から参加した購読者にも最初から配信する
+    """
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = None
+
+class RequestCoalescer:
+    """
+    同じペイロードで実行中のブリッジへのリクエストに後続のリクエストを相乗りさせる
+    """
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+
+    def is_inflight(self, payload: Dict) -> bool:
+        if not COALESCE_ENABLED:
+            return False
+        key = get_payload_key(payload)
+        return key in self._calls or key in self._streams
+
+    async def call(self, payload: Dict, fetch: Callable):
+        """
+        Args:
+            fetch: ブリッジへリクエストして結果を返す引数なしのコルーチン関数
+        """
+        if not COALESCE_ENABLED:
+            return await fetch()
+
+        key = get_payload_key(payload)
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _produce(self, key: str, flight: StreamFlight, open_stream: Callable):
+        try:
+            async for chunk in open_stream():
+                async with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    async def stream(self, payload: Dict, open_stream: Callable, on_done: Optional[Callable] = None) -> AsyncIterator:
+        """
+        Args:
+            open_stream: ブリッジへリクエストしてチャンクを順に返す非同期ジェネレータ関数
+            on_done: 上流の生成が終わったときに1回だけ呼ぶ引数なしの関数
+                （相乗りした購読者が残っている間は呼ばれない。既存の生成に相乗りした場合はすぐに呼ぶ）
+        """
+        if not COALESCE_ENABLED:
+            try:
+                async for chunk in open_stream():
+                    yield chunk
+            finally:
+                if on_done is not None:
+                    on_done()
+            return
+
+        key = get_payload_key(payload)
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, open_stream))
+            if on_done is not None:
+                flight.task.add_done_callback(lambda _: on_done())
+        elif on_done is not None:
+            on_done()
+
+        flight.subscribers += 1
+        try:
+            index = 0
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                    chunks = flight.chunks[index:]
+                    done = flight.done
+
+                for chunk in chunks:
+                    yield chunk
+                index += len(chunks)
+
+                if done and index >= len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            # 全員が切断した場合は生成を中止する
+            if flight.subscribers == 0 and not flight.done:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                flight.task.cancel()
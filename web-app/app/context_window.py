@@ -0,0 +1,112 @@
+from typing import Dict, List, Tuple
+import os
+import httpx
+
+# ブリッジへ送る会話履歴の上限トークン数（推定値）
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '3000'))
+
+# 1: 上限を超えた古い会話を要約して履歴に残す
+CONTEXT_SUMMARIZE = os.environ.get('CONTEXT_SUMMARIZE', '0') == '1'
+
+# 1メッセージあたりの役割・区切りのトークン数
+MESSAGE_TOKEN_OVERHEAD = 4
+
+SUMMARY_PREFIX = "これまでの会話の要約: "
+
+# 上限を超える質問を切り詰めた箇所に入れる文字列
+TRUNCATION_MARKER = "\n…（長すぎるため省略）…\n"
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数を推定する（日本語などの非ASCII文字は1文字1トークン、ASCIIは4文字1トークン）
+    """
+    ascii_count = sum(1 for c in text if c.isascii())
+    return (len(text) - ascii_count) + (ascii_count + 3) // 4
+
+def estimate_message_tokens(message: Dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD
+
+def is_summary_message(message: Dict) -> bool:
+    return message["role"] == "system" and message["content"].startswith(SUMMARY_PREFIX)
+
+def split_messages(messages: List[Dict], token_budget: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    新しいメッセージから上限トークン数に収まる分を残し、(収まらない古いメッセージ, 残すメッセージ)に分ける
+    最新のメッセージ（質問）は上限を超えていても必ず残す
+    """
+    kept_tokens = 0
+    index = len(messages)
+    while index > 0:
+        message_tokens = estimate_message_tokens(messages[index - 1])
+        if index < len(messages) and kept_tokens + message_tokens > token_budget:
+            break
+        kept_tokens += message_tokens
+        index -= 1
+    return messages[:index], messages[index:]
+
+def shorten_text(text: str, length: int) -> str:
+    """
+    先頭と末尾を残し、中間を省略して length 文字（と省略の印）にする
+    """
+    tail_length = length // 2
+    return text[:length - tail_length] + TRUNCATION_MARKER + text[len(text) - tail_length:]
+
+def truncate_message(message: Dict, token_budget: int) -> Dict:
+    """
+    上限トークン数を超えるメッセージの本文の中間を省略して収める
+    """
+    if estimate_message_tokens(message) <= token_budget:
+        return message
+
+    content = message["content"]
+    low, high = 0, len(content) - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(shorten_text(content, middle)) + MESSAGE_TOKEN_OVERHEAD <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return {**message, "content": shorten_text(content, low)}
+
+def fit_messages(messages: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[Dict]:
+    """
+    上限トークン数に収まるように古いメッセージを切り捨てる
+    最新のメッセージ（質問）は必ず残し（上限を超える場合は切り詰める）、次に先頭の要約を可能な限り残す
+    """
+    if not messages:
+        return []
+
+    latest = truncate_message(messages[-1], token_budget)
+    remaining_tokens = token_budget - estimate_message_tokens(latest)
+    history = messages[:-1]
+
+    summary = []
+    if history and is_summary_message(history[0]):
+        summary_tokens = estimate_message_tokens(history[0])
+        if summary_tokens <= remaining_tokens:
+            summary = [history[0]]
+            remaining_tokens -= summary_tokens
+        history = history[1:]
+
+    _, kept = split_messages([*history, latest], remaining_tokens + estimate_message_tokens(latest))
+    return [*summary, *kept]
+
+async def summarize_messages(http_client: httpx.AsyncClient, bridge_url: str, model_name: str, messages: List[Dict]) -> str:
+    conversation = "\n".join(
+        f"{message['role']}: {message['content'].removeprefix(SUMMARY_PREFIX)}" for message in messages
+    )
+    payload = {
+        "model": model_name,
+        "messages": [{
+            "role": "user",
+            "content": (
+                "以下の会話を、後続の質問に答えるために必要な事実（人名・組織名・数値など）を残して"
+                "300文字以内の日本語で要約してください。ツールは使用しないでください。\n\n" + conversation
+            ),
+        }],
+        "stream": False
+    }
+
+    resp = await http_client.post(bridge_url, json=payload)
+    resp.raise_for_status()
+    return resp.json().get('message', {}).get('content', '')
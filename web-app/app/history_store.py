@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 会話履歴の保存先（memory: プロセス内、sqlite: SQLiteファイル。複数ワーカー・再起動後も共有される）
+HISTORY_BACKEND = os.environ.get('HISTORY_BACKEND', 'memory')
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', str(BASE_DIR / 'history.db'))
+
+# 最後の利用からこの秒数が経過した会話履歴は破棄する
+HISTORY_IDLE_TTL = int(os.environ.get('HISTORY_IDLE_TTL', '86400'))
+
+# メモリ保持時の上限（会話数・本文の合計バイト数）
+HISTORY_MAX_KEYS = int(os.environ.get('HISTORY_MAX_KEYS', '10000'))
+HISTORY_MAX_BYTES = int(os.environ.get('HISTORY_MAX_BYTES', str(64 * 1024 * 1024)))
+
+def get_message_size(message: Dict) -> int:
+    return len(message["content"].encode("utf-8"))
+
+def to_history_message(message_id: int, role: str, content: str, with_ids: bool) -> Dict:
+    message = {"role": role, "content": content}
+    if with_ids:
+        message["id"] = message_id
+    return message
+
+class MemoryHistoryStore:
+    """
+    プロセス内に会話履歴を保持する
+    最後に利用された順に並べ、期限切れ・会話数上限・メモリ上限を超えた古い会話から破棄する
+    各メッセージには要約での置き換え対象を特定するためのIDを振る
+    """
+    def __init__(self, idle_ttl: int = HISTORY_IDLE_TTL, max_keys: int = HISTORY_MAX_KEYS, max_bytes: int = HISTORY_MAX_BYTES):
+        self._idle_ttl = idle_ttl
+        self._max_keys = max_keys
+        self._max_bytes = max_bytes
+        self._histories = OrderedDict()
+        self._total_bytes = 0
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _remove(self, request_key: str):
+        _, messages = self._histories.pop(request_key)
+        self._total_bytes -= sum(get_message_size(message) for message in messages)
+
+    def _evict(self):
+        expire_time = time.time() - self._idle_ttl
+        while self._histories:
+            request_key, (last_access, _) = next(iter(self._histories.items()))
+            if last_access >= expire_time:
+                # 直近に利用された会話は上限を超えていても残す
+                if len(self._histories) == 1:
+                    break
+                if len(self._histories) <= self._max_keys and self._total_bytes <= self._max_bytes:
+                    break
+            self._remove(request_key)
+
+    def get(self, request_key: str, with_ids: bool = False) -> List[Dict]:
+        """
+        Args:
+            with_ids: Trueの場合、各メッセージにID（id）を含める（compact の対象の指定に使う）
+        """
+        with self._lock:
+            self._evict()
+            if request_key not in self._histories:
+                return []
+            self._histories[request_key] = (time.time(), self._histories[request_key][1])
+            self._histories.move_to_end(request_key)
+            return [
+                to_history_message(message["id"], message["role"], message["content"], with_ids)
+                for message in self._histories[request_key][1]
+            ]
+
+    def append(self, request_key: str, message: Dict, max_history: int):
+        with self._lock:
+            last_access, messages = self._histories.pop(request_key, (None, []))
+            # 期限切れの会話には追加せず、新しい会話として始める
+            if last_access is not None and last_access < time.time() - self._idle_ttl:
+                self._total_bytes -= sum(get_message_size(m) for m in messages)
+                messages = []
+            messages.append({"id": next(self._message_ids), "role": message["role"], "content": message["content"]})
+            self._total_bytes += get_message_size(message)
+
+            # 先頭の要約は件数の上限に含めず残す
+            start = 1 if messages and messages[0].get("summary") else 0
+            while len(messages) - start > max_history:
+                self._total_bytes -= get_message_size(messages.pop(start))
+
+            self._histories[request_key] = (time.time(), messages)
+            self._evict()
+
+    def compact(self, request_key: str, message_ids: List[int], message: Dict) -> bool:
+        """
+        先頭のメッセージ（message_ids）を1件のメッセージ（要約）に置き換える
+        要約している間に先頭のメッセージが変わった（破棄・追加された）場合は置き換えない
+
+        Returns:
+            置き換えた場合はTrue
+        """
+        with self._lock:
+            if request_key not in self._histories or not message_ids:
+                return False
+            messages = self._histories[request_key][1]
+            count = len(message_ids)
+            if [m["id"] for m in messages[:count]] != message_ids:
+                return False
+
+            self._total_bytes -= sum(get_message_size(m) for m in messages[:count])
+            messages[:count] = [{"id": message_ids[0], "role": message["role"], "content": message["content"], "summary": True}]
+            self._total_bytes += get_message_size(message)
+            return True
+
+class SqliteHistoryStore:
+    """
+    SQLiteに会話履歴を保持する（WALモードのため複数ワーカーから同時に利用できる）
+    """
+    def __init__(self, db_path: str = HISTORY_DB_PATH, idle_ttl: int = HISTORY_IDLE_TTL):
+        self._db_path = db_path
+        self._idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._last_evict_time = 0
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, request_key TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_messages_request_key ON messages (request_key, id)")
+            # 要約のメッセージ（件数の上限に含めない）の印。以前のテーブルには列を追加する
+            if "summary" not in [row[1] for row in connection.execute("PRAGMA table_info(messages)")]:
+                connection.execute("ALTER TABLE messages ADD COLUMN summary INTEGER NOT NULL DEFAULT 0")
+            connection.execute("CREATE TABLE IF NOT EXISTS conversations (request_key TEXT PRIMARY KEY, last_access REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_conversations_last_access ON conversations (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._db_path, timeout=10)
+            self._local.connection = connection
+        return connection
+
+    def _evict(self, connection: sqlite3.Connection):
+        # 期限切れの会話の削除は1分に1回まで
+        now = time.time()
+        if now - self._last_evict_time < 60:
+            return
+        self._last_evict_time = now
+
+        expire_time = now - self._idle_ttl
+        connection.execute(
+            "DELETE FROM messages WHERE request_key IN (SELECT request_key FROM conversations WHERE last_access < ?)",
+            (expire_time,),
+        )
+        connection.execute("DELETE FROM conversations WHERE last_access < ?", (expire_time,))
+
+    def get(self, request_key: str, with_ids: bool = False) -> List[Dict]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT last_access FROM conversations WHERE request_key = ?", (request_key,)).fetchone()
+            if row is None or row[0] < time.time() - self._idle_ttl:
+                return []
+
+            connection.execute("UPDATE conversations SET last_access = ? WHERE request_key = ?", (time.time(), request_key))
+            rows = connection.execute(
+                "SELECT id, role, content FROM messages WHERE request_key = ? ORDER BY id", (request_key,)
+            ).fetchall()
+            return [to_history_message(id, role, content, with_ids) for id, role, content in rows]
+
+    def append(self, request_key: str, message: Dict, max_history: int):
+        with self._connect() as connection:
+            # 期限切れの会話には追加せず、新しい会話として始める
+            row = connection.execute("SELECT last_access FROM conversations WHERE request_key = ?", (request_key,)).fetchone()
+            if row is not None and row[0] < time.time() - self._idle_ttl:
+                connection.execute("DELETE FROM messages WHERE request_key = ?", (request_key,))
+
+            connection.execute(
+                "INSERT INTO messages (request_key, role, content) VALUES (?, ?, ?)",
+                (request_key, message["role"], message["content"]),
+            )
+            # 要約は件数の上限に含めず残す
+            connection.execute(
+                "DELETE FROM messages WHERE request_key = ? AND summary = 0 AND id NOT IN "
+                "(SELECT id FROM messages WHERE request_key = ? AND summary = 0 ORDER BY id DESC LIMIT ?)",
+                (request_key, request_key, max_history),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO conversations (request_key, last_access) VALUES (?, ?)",
+                (request_key, time.time()),
+            )
+            self._evict(connection)
+
+    def compact(self, request_key: str, message_ids: List[int], message: Dict) -> bool:
+        """
+        先頭のメッセージ（message_ids）を1件のメッセージ（要約）に置き換える
+        要約している間に先頭のメッセージが変わった（破棄・追加された）場合は置き換えない
+
+        Returns:
+            置き換えた場合はTrue
+        """
+        if not message_ids:
+            return False
+
+        with self._connect() as connection:
+            # 確認から置き換えまでの間に他のワーカーが書き込まないようにする
+            connection.execute("BEGIN IMMEDIATE")
+            ids = [row[0] for row in connection.execute(
+                "SELECT id FROM messages WHERE request_key = ? ORDER BY id LIMIT ?", (request_key, len(message_ids))
+            )]
+            if ids != message_ids:
+                return False
+            connection.execute(
+                "UPDATE messages SET role = ?, content = ?, summary = 1 WHERE id = ?", (message["role"], message["content"], ids[0])
+            )
+            connection.executemany("DELETE FROM messages WHERE id = ?", [(id,) for id in ids[1:]])
+            return True
+
+def create_history_store():
+    if HISTORY_BACKEND == 'sqlite':
+        return SqliteHistoryStore()
+    return MemoryHistoryStore()
@@ -0,0 +1,32 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from fastapi import Response
+
+# 応答の最初の文字が届くまでの時間（順番待ちを含む）と生成全体の時間（秒）
+TIME_TO_FIRST_TOKEN = Histogram(
+    "web_chat_time_to_first_token_seconds", "/chat/streamで最初の応答が届くまでの時間（秒）",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+GENERATION_SECONDS = Histogram(
+    "web_chat_generation_duration_seconds", "応答の生成にかかった時間（秒）", ["endpoint"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+TOKENS_PER_SECOND = Histogram(
+    "web_chat_tokens_per_second", "生成速度（推定トークン数/秒）", ["endpoint"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200),
+)
+GENERATED_TOKENS = Counter("web_chat_generated_tokens_total", "生成した推定トークン数", ["endpoint"])
+CHAT_REQUESTS = Counter("web_chat_requests_total", "チャットのリクエスト数", ["endpoint", "result"])
+
+# 順番待ち
+QUEUE_DEPTH = Gauge("web_generation_queue_depth", "生成の順番待ちをしているリクエスト数")
+RUNNING_GENERATIONS = Gauge("web_generation_running", "生成中のリクエスト数")
+QUEUE_WAIT_SECONDS = Histogram(
+    "web_generation_queue_wait_seconds", "生成の順番待ちの時間（秒）",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+
+# 回答キャッシュ（result: hit / miss）
+ANSWER_CACHE_LOOKUPS = Counter("web_answer_cache_lookups_total", "回答キャッシュの参照回数", ["result"])
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,137 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+from metrics import QUEUE_WAIT_SECONDS
+
+# ブリッジ（Ollama）で同時に生成する最大数
+MAX_CONCURRENT_GENERATIONS = int(os.environ.get('MAX_CONCURRENT_GENERATIONS', '2'))
+
+# 推定待ち時間がこの秒数を超える場合は受け付けない
+MAX_QUEUE_WAIT = float(os.environ.get('MAX_QUEUE_WAIT', '120'))
+
+# 待ち時間推定に使う1回の生成時間の初期値（秒）。実績の移動平均で更新する
+INITIAL_GENERATION_SECONDS = float(os.environ.get('INITIAL_GENERATION_SECONDS', '20'))
+
+# 順番待ちの状況を通知する間隔（秒）
+QUEUE_NOTIFY_INTERVAL = float(os.environ.get('QUEUE_NOTIFY_INTERVAL', '2'))
+
+class QueueRejected(Exception):
+    pass
+
+class Ticket:
+    def __init__(self, request_key: str):
+        self.request_key = request_key
+        self.granted = asyncio.get_running_loop().create_future()
+        self.enqueued_time = time.monotonic()
+        self.started_time = None
+
+class GenerationScheduler:
+    """
+    ブリッジへの同時生成数を制限し、待ちが発生した場合はユーザーごとに順番に（ラウンドロビンで）実行する
+    """
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_GENERATIONS, max_wait: float = MAX_QUEUE_WAIT):
+        self._max_concurrent = max_concurrent
+        self._max_wait = max_wait
+        self._running = 0
+        self._queues = OrderedDict()
+        self._average_seconds = INITIAL_GENERATION_SECONDS
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def running(self) -> int:
+        return self._running
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        先に実行される待ち件数を返す（ラウンドロビンの順序で計算する）
+        """
+        queue = self._queues.get(ticket.request_key)
+        if queue is None or ticket not in queue:
+            return 0
+
+        index = queue.index(ticket)
+        ahead = index
+        before_own_key = True
+        for request_key, other_queue in self._queues.items():
+            if request_key == ticket.request_key:
+                before_own_key = False
+                continue
+            ahead += min(len(other_queue), index + 1 if before_own_key else index)
+        return ahead
+
+    def estimated_wait(self, ahead: int) -> float:
+        if self._running < self._max_concurrent and ahead == 0:
+            return 0.0
+        return (ahead // self._max_concurrent + 1) * self._average_seconds
+
+    def _dispatch(self):
+        while self._running < self._max_concurrent and self._queues:
+            request_key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(request_key)
+            else:
+                del self._queues[request_key]
+
+            if ticket.granted.done():
+                continue
+            self._running += 1
+            ticket.started_time = time.monotonic()
+            ticket.granted.set_result(True)
+            QUEUE_WAIT_SECONDS.observe(ticket.started_time - ticket.enqueued_time)
+
+    def enqueue(self, request_key: str) -> Ticket:
+        ticket = Ticket(request_key)
+        self._queues.setdefault(request_key, deque()).append(ticket)
+
+        ahead = self.position(ticket)
+        if self.estimated_wait(ahead) > self._max_wait:
+            self._remove(ticket)
+            raise QueueRejected(f"混雑しているため受け付けできませんでした（推定待ち時間 {int(self.estimated_wait(ahead))} 秒）")
+
+        self._dispatch()
+        return ticket
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues.get(ticket.request_key)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.request_key]
+
+    async def wait(self, ticket: Ticket, timeout: float) -> bool:
+        """
+        実行可能になるまで最大timeout秒待つ（実行可能になった場合はTrue）
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.granted), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self, ticket: Ticket):
+        if ticket.started_time is not None:
+            self._running -= 1
+            elapsed = time.monotonic() - ticket.started_time
+            self._average_seconds = self._average_seconds * 0.8 + elapsed * 0.2
+            ticket.started_time = None
+        else:
+            self._remove(ticket)
+            if not ticket.granted.done():
+                ticket.granted.cancel()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, request_key: str):
+        """
+        実行可能になるまで待ってから処理を行う（順番待ちの通知が不要な場合に使用する）
+        """
+        ticket = self.enqueue(request_key)
+        try:
+            await ticket.granted
+            yield
+        finally:
+            self.release(ticket)
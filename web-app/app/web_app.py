@@ -3,13 +3,46 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import os
-import requests
+import httpx
 import uuid
 import json
 from typing import Dict, List
+from history_store import create_history_store
+from context_window import *
+from answer_cache import AnswerCache, split_answer
+from coalesce import RequestCoalescer
+from scheduler import *
+from metrics import *
+import asyncio
+import functools
+import sys
+import time
 
-app = FastAPI()
+# 環境変数
+BRIDGE_URL = os.environ.get('OLLAMA_BRIDGE_URL', 'http://mcp-bridge:8000/api/chat')
+MODEL_NAME = os.environ.get('OLLAMA_MODEL', 'llama3.1:8b')
+BRIDGE_MAX_CONNECTIONS = int(os.environ.get('BRIDGE_MAX_CONNECTIONS', '500'))
+BRIDGE_TIMEOUT = float(os.environ.get('BRIDGE_TIMEOUT', '120'))
+
+# ブリッジへの接続を使い回すHTTPクライアント
+http_client: httpx.AsyncClient = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=BRIDGE_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=BRIDGE_MAX_CONNECTIONS,
+            max_keepalive_connections=BRIDGE_MAX_CONNECTIONS,
+        ),
+    )
+    yield
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS設定
 app.add_middleware(
@@ -19,12 +52,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 環境変数
-BRIDGE_URL = os.environ.get('OLLAMA_BRIDGE_URL', 'http://mcp-bridge:8000/api/chat')
-MODEL_NAME = os.environ.get('OLLAMA_MODEL', 'llama3.1:8b')
-
 # ユーザーごとの会話履歴を保持
-conversation_history: Dict[str, List[Dict]] = {}
+history_store = create_history_store()
 
 # 保持する最大件数
 MAX_HISTORY =10
@@ -45,25 +74,97 @@ def get_or_create_session_id(request: Request, response: Response) -> str:
         )
     return session_id
 
-def add_conversation_history(request_key: str, role: str, message: str):
-    if request_key not in conversation_history:
-        conversation_history[request_key] = []
+# 会話履歴の読み書きは（SQLiteのロック待ちで）イベントループを止めないよう別スレッドで行う
+async def add_conversation_history(request_key: str, role: str, message: str):
+    await asyncio.to_thread(history_store.append, request_key, {"role": role, "content": message}, MAX_HISTORY)
+
+async def get_conversation_history(request_key: str) -> List[Dict]:
+    return await asyncio.to_thread(history_store.get, request_key)
+
+async def get_request_messages(request_key: str, message: str) -> List[Dict]:
+    """
+    ブリッジへ送る会話履歴を返す（履歴が破棄・変更された場合も、最後のメッセージは必ず今回の質問にする）
+    """
+    messages = await get_conversation_history(request_key)
+    if not messages or messages[-1]["role"] != "user" or messages[-1]["content"] != message:
+        messages.append({"role": "user", "content": message})
+    return messages
+
+# 同じ質問への回答を再利用するキャッシュ
+answer_cache = AnswerCache()
 
-    conversation_history[request_key].append({"role": role, "content": message})
+# 同じリクエストの同時生成をまとめる
+request_coalescer = RequestCoalescer()
 
-    if len(conversation_history[request_key]) > MAX_HISTORY:
-        conversation_history[request_key] = conversation_history[request_key][-MAX_HISTORY:]
+# ブリッジへの同時生成数の制限と順番待ち
+generation_scheduler = GenerationScheduler()
+QUEUE_DEPTH.set_function(generation_scheduler.queue_depth)
+RUNNING_GENERATIONS.set_function(generation_scheduler.running)
+
+# 実行中の要約タスク（GCで破棄されないよう参照を保持する）
+summary_tasks = set()
+
+async def summarize_conversation_history(request_key: str):
+    """
+    上限トークン数の半分を超えた古い会話を要約し、履歴の先頭を要約1件に置き換える
+    要約している間に履歴の先頭が変わった場合は、要約していないメッセージを消さないよう置き換えない
+    """
+    try:
+        messages = await asyncio.to_thread(history_store.get, request_key, with_ids=True)
+        old_messages, _ = split_messages(messages, CONTEXT_TOKEN_BUDGET // 2)
+        if len(old_messages) < 2:
+            return
+
+        # 要約もブリッジでの生成なので、同時生成数の制限と順番待ちに従う
+        async with generation_scheduler.slot(request_key):
+            summary = await summarize_messages(http_client, BRIDGE_URL, MODEL_NAME, old_messages)
+        if summary:
+            await asyncio.to_thread(
+                history_store.compact, request_key,
+                [message["id"] for message in old_messages], {"role": "system", "content": SUMMARY_PREFIX + summary},
+            )
+    except Exception as e:
+        print(f"web-error: 会話履歴の要約に失敗しました: {e}", file=sys.stderr)
+
+def observe_generation(endpoint: str, start_time: float, first_token_time: float, reply: str):
+    """
+    ブリッジでの1回の生成について、生成時間と生成速度を記録する
+    """
+    end_time = time.perf_counter()
+    tokens = estimate_tokens(reply)
+    GENERATION_SECONDS.labels(endpoint).observe(end_time - start_time)
+    GENERATED_TOKENS.labels(endpoint).inc(tokens)
+    # ストリームでは最初の応答以降、それ以外は全体の時間で割る
+    decode_seconds = end_time - (first_token_time or start_time)
+    if tokens and decode_seconds > 0:
+        TOKENS_PER_SECOND.labels(endpoint).observe(tokens / decode_seconds)
+
+def schedule_conversation_summary(request_key: str):
+    if not CONTEXT_SUMMARIZE:
+        return
+    task = asyncio.create_task(summarize_conversation_history(request_key))
+    summary_tasks.add(task)
+    task.add_done_callback(summary_tasks.discard)
 
 @app.post("/chat")
-def chat(req: ChatRequest, request: Request, response: Response):
+async def chat(req: ChatRequest, request: Request, response: Response):
     session_id = get_or_create_session_id(request, response)
     request_key = f"{session_id}_{req.user_id}"
 
-    add_conversation_history(request_key, "user", req.message)
+    await add_conversation_history(request_key, "user", req.message)
     
-    request_messages = [
-        *conversation_history[request_key],
-    ]
+    request_messages = await get_request_messages(request_key, req.message)
+
+    # 会話の文脈に依存しない最初の質問のみ回答キャッシュを利用する
+    use_answer_cache = len(request_messages) == 1
+    if use_answer_cache:
+        data_fingerprint = answer_cache.current_fingerprint()
+        cached = await answer_cache.lookup(http_client, req.message)
+        if cached is not None:
+            await add_conversation_history(request_key, "assistant", cached["answer"])
+            CHAT_REQUESTS.labels("chat", "cached").inc()
+            return {"reply": cached["answer"]}
+
     request_messages[-1]["content"] = f"""
         質問: {request_messages[-1]["content"]}
         回答は以下の構成でお願いします:
@@ -71,6 +172,7 @@ def chat(req: ChatRequest, request: Request, response: Response):
         2. 詳細
         3. 補足
         """
+    request_messages = fit_messages(request_messages)
 
     # Ollama に送信
     payload = {
@@ -79,26 +181,58 @@ def chat(req: ChatRequest, request: Request, response: Response):
         "stream": False
     }
 
-    try:
-        resp = requests.post(BRIDGE_URL, json=payload, timeout=120)
+    async def post_bridge():
+        start_time = time.perf_counter()
+        resp = await http_client.post(BRIDGE_URL, json=payload)
         resp.raise_for_status()
         result = resp.json()
+        observe_generation("chat", start_time, None, result.get('message', {}).get('content', ''))
+        return result
+
+    try:
+        if request_coalescer.is_inflight(payload):
+            result = await request_coalescer.call(payload, post_bridge)
+        else:
+            async with generation_scheduler.slot(request_key):
+                result = await request_coalescer.call(payload, post_bridge)
         ai_message = result.get('message', {}).get('content', 'AIから応答が返っていません')
 
-        add_conversation_history(request_key, "assistant", ai_message)
+        await add_conversation_history(request_key, "assistant", ai_message)
+        schedule_conversation_summary(request_key)
+        if use_answer_cache and 'message' in result:
+            await answer_cache.store(http_client, req.message, ai_message, data_fingerprint)
 
+        CHAT_REQUESTS.labels("chat", "success").inc()
         return {"reply": ai_message}
 
+    except QueueRejected as e:
+        CHAT_REQUESTS.labels("chat", "rejected").inc()
+        response.status_code = 503
+        return {"reply": str(e)}
     except Exception as e:
+        CHAT_REQUESTS.labels("chat", "error").inc()
         print(f"web-error: {e}")
         return {"reply": f"エラー: {e}"}
 
-def stream_ollama(request_key: str, message: str):
-    add_conversation_history(request_key, "user", message)
+async def stream_ollama(request_key: str, message: str):
+    request_start_time = time.perf_counter()
+    await add_conversation_history(request_key, "user", message)
+
+    request_messages = await get_request_messages(request_key, message)
+
+    # 会話の文脈に依存しない最初の質問のみ回答キャッシュを利用する
+    use_answer_cache = len(request_messages) == 1
+    if use_answer_cache:
+        data_fingerprint = answer_cache.current_fingerprint()
+        cached = await answer_cache.lookup(http_client, message)
+        if cached is not None:
+            for chunk in split_answer(cached["answer"]):
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+            await add_conversation_history(request_key, "assistant", cached["answer"])
+            CHAT_REQUESTS.labels("chat_stream", "cached").inc()
+            return
 
-    request_messages = [
-        *conversation_history[request_key],
-    ]
     request_messages[-1]["content"] = f"""
         質問: {request_messages[-1]["content"]}
         回答は以下の構成でお願いします:
@@ -106,6 +240,7 @@ def stream_ollama(request_key: str, message: str):
         2. 詳細
         3. 補足
         """
+    request_messages = fit_messages(request_messages)
     
     payload = {
         "model": MODEL_NAME,
@@ -113,27 +248,73 @@ def stream_ollama(request_key: str, message: str):
         "stream": True
     }
 
-    full_reply = ""
-    with requests.post(BRIDGE_URL, json=payload, stream=True, timeout=120) as r:
-        r.raise_for_status()
+    async def stream_bridge():
+        start_time = time.perf_counter()
+        first_token_time = None
+        reply = ""
+        async with http_client.stream("POST", BRIDGE_URL, json=payload) as r:
+            r.raise_for_status()
+
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+
+                data = json.loads(line)
 
-        for line in r.iter_lines():
-            if not line:
-                continue
+                content = data.get("message", {}).get("content")
+                if content:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                    reply += content
+                    yield content
+        observe_generation("chat_stream", start_time, first_token_time, reply)
 
-            data = json.loads(line.decode("utf-8"))
+    # 生成中の同じリクエストに相乗りする場合は順番待ちしない
+    ticket = None
+    if not request_coalescer.is_inflight(payload):
+        try:
+            ticket = generation_scheduler.enqueue(request_key)
+        except QueueRejected as e:
+            CHAT_REQUESTS.labels("chat_stream", "rejected").inc()
+            yield f"data: {json.dumps(str(e))}\n\n"
+            yield "data: [DONE]\n\n"
+            return
 
-            content = data.get("message", {}).get("content")
-            if content:
-                full_reply += content
-                yield f"data: {json.dumps(content)}\n\n"
+    # 生成を始めた後の実行枠は、相乗りした購読者が残っていても上流の生成が終わるまで解放しない
+    release_ticket = None
+    full_reply = ""
+    try:
+        if ticket is not None:
+            while not ticket.granted.done():
+                ahead = generation_scheduler.position(ticket)
+                queue_status = {"position": ahead + 1, "estimated_wait": int(generation_scheduler.estimated_wait(ahead))}
+                yield f"event: queue\ndata: {json.dumps(queue_status)}\n\n"
+                await generation_scheduler.wait(ticket, QUEUE_NOTIFY_INTERVAL)
+            release_ticket = functools.partial(generation_scheduler.release, ticket)
+            ticket = None
 
-        yield "data: [DONE]\n\n"
+        async for content in request_coalescer.stream(payload, stream_bridge, on_done=release_ticket):
+            if not full_reply:
+                TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - request_start_time)
+            full_reply += content
+            yield f"data: {json.dumps(content)}\n\n"
+    except Exception:
+        CHAT_REQUESTS.labels("chat_stream", "error").inc()
+        raise
+    finally:
+        if ticket is not None:
+            generation_scheduler.release(ticket)
 
-    add_conversation_history(request_key, "assistant", full_reply)
+    yield "data: [DONE]\n\n"
+    CHAT_REQUESTS.labels("chat_stream", "success").inc()
+
+    await add_conversation_history(request_key, "assistant", full_reply)
+    schedule_conversation_summary(request_key)
+    if use_answer_cache and full_reply:
+        await answer_cache.store(http_client, message, full_reply, data_fingerprint)
 
 @app.post("/chat/stream")
-def chat_stream(req: ChatRequest, request: Request, response: Response):
+async def chat_stream(req: ChatRequest, request: Request, response: Response):
     session_id = get_or_create_session_id(request, response)
     request_key = f"{session_id}_{req.user_id}"
 
@@ -142,6 +323,10 @@ def chat_stream(req: ChatRequest, request: Request, response: Response):
         media_type="text/event-stream"
     )
 
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
 @app.get("/")
 def root():
     return FileResponse("index.html")